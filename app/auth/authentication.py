@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 
-from sqlalchemy.orm.session import Session
+from sqlalchemy import case, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.outh2 import create_access_token
-from database.database import get_db
+from database.database import get_async_db
 from database.models import User
-from database.hashing import verify
+from database.hashing import verify_async
 
 router = APIRouter(
     tags=['Authentication']
@@ -15,20 +16,18 @@ router = APIRouter(
 
 @router.post('/login')
 async def login(request: OAuth2PasswordRequestForm = Depends(),
-                db: Session = Depends(get_db)):
+                db: AsyncSession = Depends(get_async_db)):
     request_username = request.username
-    user_username = db.query(User).filter(User.username ==
-                                          request_username).first()
-    user_email = db.query(User).filter(User.email ==
-                                       request.username).first()
-    
-    user = user_email if not user_username else user_username
+    # one query for either field, preferring a username match
+    user = await db.scalar(select(User).where(
+        or_(User.username == request_username, User.email == request_username)
+    ).order_by(case((User.username == request_username, 0), else_=1)).limit(1))
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail='Invalid Username or Email.')
 
-    if not verify(user.password, request.password):
+    if not await verify_async(user.password, request.password):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail='Incorrect password.')
     access_token = create_access_token(data={'username': user.username})
@@ -3,10 +3,12 @@ from typing import Optional
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from fastapi import HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.database import get_db
+from database.database import get_async_db
 from database import db_user
+from schema.schemas import UserPrincipal
+from . import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -26,9 +28,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
 ):
+    principal = user_cache.get(token)
+    if principal:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -41,7 +47,11 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db_user.get_user_by_username(username, db)
+    loaded_generation = user_cache.generation()
+    user = await db_user.get_user_by_username(username, db)
     if user is None:
         raise credentials_exception
-    return user
+
+    principal = UserPrincipal.model_validate(user)
+    user_cache.put(token, principal, payload["exp"], loaded_generation)
+    return principal
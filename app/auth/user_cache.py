@@ -0,0 +1,116 @@
+"""Per-process cache of verified access tokens.
+
+get_current_user runs on every authenticated request. Once a token has been
+decoded and its user loaded, the token maps to a small, immutable
+UserPrincipal here, so later requests with the same token skip both the JWT
+verification and the user query.
+
+Entries live at most CASHER_AUTH_CACHE_SECONDS and never past the token's
+own expiry, and the least recently used entry is evicted once the cache
+holds CASHER_AUTH_CACHE_SIZE tokens. Every token is indexed by user id, so
+db_user drops all of a user's entries as soon as the user is edited,
+deleted or changes password.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+AUTH_CACHE_SIZE = int(os.environ.get("CASHER_AUTH_CACHE_SIZE", 4096))
+AUTH_CACHE_SECONDS = float(os.environ.get("CASHER_AUTH_CACHE_SECONDS", 60))
+
+_lock = threading.Lock()
+# token -> (principal, expires at)
+_entries = OrderedDict()
+# user id -> tokens of that user in _entries
+_user_tokens = {}
+# bumped by every invalidation, so a user loaded while one ran is not
+# put back into the cache
+_generation = 0
+_metrics = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "expirations": 0,
+    "invalidations": 0,
+}
+
+
+def _remove(token: str):
+    principal, _ = _entries.pop(token)
+    tokens = _user_tokens.get(principal.id)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del _user_tokens[principal.id]
+
+
+def get(token: str):
+    """The cached principal of `token`, or None."""
+    with _lock:
+        entry = _entries.get(token)
+        if entry is None:
+            _metrics["misses"] += 1
+            return None
+
+        principal, expires_at = entry
+        if expires_at <= time.monotonic():
+            _remove(token)
+            _metrics["expirations"] += 1
+            _metrics["misses"] += 1
+            return None
+
+        _entries.move_to_end(token)
+        _metrics["hits"] += 1
+        return principal
+
+
+def generation():
+    """Read before loading a user; pass to put() afterwards."""
+    with _lock:
+        return _generation
+
+
+def put(token: str, principal, token_expiry: float, loaded_generation: int):
+    """Cache `principal` for `token`, which expires at the unix time
+    `token_expiry`. Skipped when any user was invalidated since
+    `loaded_generation` was read."""
+    ttl = min(AUTH_CACHE_SECONDS, token_expiry - time.time())
+    if ttl <= 0:
+        return
+
+    with _lock:
+        if _generation != loaded_generation:
+            return
+
+        if token in _entries:
+            _remove(token)
+        _entries[token] = (principal, time.monotonic() + ttl)
+        _user_tokens.setdefault(principal.id, set()).add(token)
+
+        while len(_entries) > AUTH_CACHE_SIZE:
+            _remove(next(iter(_entries)))
+            _metrics["evictions"] += 1
+
+
+def invalidate_user(user_id: int):
+    """Forget every cached token of `user_id`."""
+    global _generation
+    with _lock:
+        _generation += 1
+        for token in list(_user_tokens.get(user_id, ())):
+            _remove(token)
+            _metrics["invalidations"] += 1
+
+
+def cache_metrics():
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["size"] = len(_entries)
+
+    lookups = metrics["hits"] + metrics["misses"]
+    metrics["max_size"] = AUTH_CACHE_SIZE
+    metrics["ttl_seconds"] = AUTH_CACHE_SECONDS
+    metrics["hit_ratio"] = metrics["hits"] / lookups if lookups else 0.0
+
+    return metrics
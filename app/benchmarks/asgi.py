@@ -0,0 +1,45 @@
+"""Calls ASGI apps directly, without a server or network, for the
+benchmarks."""
+import asyncio
+
+
+async def fetch(app, path: str, headers=()):
+    """GET `path` from `app`; returns (status, response headers, body bytes)."""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 1234),
+    }
+    response = {"headers": {}, "body": 0}
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # streamed responses listen for the client going away
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                name.decode(): value.decode() for name, value in message["headers"]
+            }
+        else:
+            response["body"] += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
@@ -0,0 +1,154 @@
+"""Concurrent sale reads through a blocking Session and an AsyncSession.
+
+Before the asyncio database layer the routes were `async def` handlers
+calling db_sales through the synchronous Session, so every query blocked
+the event loop. This runs CONCURRENCY simulated clients, each issuing
+requests back to back, once that way and once through AsyncSession. Every
+request reads the first page of the user's sales (the SQL of
+db_sales.user_sales) and their all-time totals from the daily rollup.
+
+Each request yields to the loop once before it queries, as a real request
+does while its body and dependencies are read, so a request also waits
+for whatever holds the loop. The latency of a request therefore covers
+that wait as well as its own queries.
+
+A local SQLite file answers in a fraction of a millisecond, so there is
+little to overlap; a server database adds a round trip to every
+statement. On SQLite the round trip is modelled by LATENCIES_MS: each
+statement calls casher_wait(), which sleeps in whichever thread runs the
+statement, the event loop's for Session and aiosqlite's for AsyncSession,
+as a blocking and an asyncio driver wait on the network. With --url the
+statements run against that database and its real round trips only.
+"""
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from benchmarks.seeding import seed_sales, seed_user
+from database import db_sales
+from database.database import make_async_engine, make_engine
+from database.models import Sale, SaleDailyRollup
+from database.pagination import keyset_select
+
+ROWS = 10_000
+REQUESTS = 2000
+CONCURRENCY = 50
+PAGE_SIZE = 50
+# modelled round trips of a statement, local and to a server on the LAN
+LATENCIES_MS = (0, 2)
+
+
+def casher_wait(milliseconds: float):
+    time.sleep(milliseconds / 1000)
+    return 0
+
+
+def register_wait(dbapi_connection, connection_record):
+    # deterministic, so SQLite calls it once per statement, not per row
+    dbapi_connection.create_function("casher_wait", 1, casher_wait, deterministic=True)
+
+
+def read_statements(user_id: int, latency_ms: float):
+    page = keyset_select(
+        db_sales.user_sales_select(user_id),
+        Sale.sold_on,
+        Sale.id,
+        PAGE_SIZE,
+        None,
+        datetime.date.fromisoformat,
+    )
+    totals = select(*db_sales.rollup_totals()).where(SaleDailyRollup.user_id == user_id)
+    if not latency_ms:
+        return page, totals
+    return tuple(
+        statement.where(func.casher_wait(latency_ms) == 0) for statement in (page, totals)
+    )
+
+
+async def sync_request(sessions, statements):
+    await asyncio.sleep(0)
+    with sessions() as db:
+        for statement in statements:
+            db.execute(statement).all()
+
+
+async def async_request(sessions, statements):
+    await asyncio.sleep(0)
+    async with sessions() as db:
+        for statement in statements:
+            (await db.execute(statement)).all()
+
+
+async def client(request, sessions, statements, requests: int, latencies: list):
+    for _ in range(requests):
+        started = time.perf_counter()
+        await request(sessions, statements)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_pattern(request, sessions, statements, requests: int, concurrency: int):
+    # warm the pool and the page cache before timing
+    await client(request, sessions, statements, concurrency, [])
+
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        client(request, sessions, statements, requests // concurrency, latencies)
+        for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+async def run(url: str, user_id: int, latency_ms: float, requests: int, concurrency: int):
+    statements = read_statements(user_id, latency_ms)
+    engine = make_engine(url)
+    async_engine = make_async_engine(url)
+    if latency_ms:
+        event.listen(engine, "connect", register_wait)
+        event.listen(async_engine.sync_engine, "connect", register_wait)
+    try:
+        return {
+            "sync": await run_pattern(
+                sync_request, sessionmaker(bind=engine), statements, requests, concurrency
+            ),
+            "async": await run_pattern(
+                async_request, async_sessionmaker(bind=async_engine), statements,
+                requests, concurrency,
+            ),
+        }
+    finally:
+        engine.dispose()
+        await async_engine.dispose()
+
+
+def benchmark(url: str = None, rows: int = ROWS, requests: int = REQUESTS,
+              concurrency: int = CONCURRENCY, latencies_ms=LATENCIES_MS):
+    """Yields (latency ms, {"sync" | "async": results}) per modelled
+    latency. Without `url` the reads run on a throwaway SQLite file."""
+    with tempfile.TemporaryDirectory() as directory:
+        if url:
+            latencies_ms = (0,)
+        url = url or f"sqlite:///{os.path.join(directory, 'reads.db')}"
+        user_id = seed_user(url)
+        seed_sales(url, user_id, rows)
+
+        engine = make_engine(url)
+        with Session(engine) as db:
+            db_sales.rebuild_daily_rollups(db, user_id)
+        engine.dispose()
+
+        for latency_ms in latencies_ms:
+            yield latency_ms, asyncio.run(run(url, user_id, latency_ms, requests, concurrency))
@@ -0,0 +1,63 @@
+"""Throughput of POST /sales/batch against one POST /sales per item.
+
+Both paths run through db_sales on a throwaway SQLite file with the tuned
+engine profile, one session per request, so the numbers compare the
+database work of each endpoint without HTTP overhead.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.seeding import seed_user
+from database import db_sales
+from database.database import make_async_engine
+from schema.schemas import SaleBase
+
+BATCH_SIZES = (10, 100, 1000)
+
+
+def sale_items(count: int):
+    return [
+        dict(item=f"item{n}", bought_amount=100, sell_amount=150,
+             mode_of_payment="cash", transaction_code="", balance=n % 2 * 10,
+             description="", sold_on=f"2023-05-{n % 28 + 1:02d}")
+        for n in range(count)
+    ]
+
+
+async def time_paths(url: str, user_id: int, size: int):
+    engine = make_async_engine(url)
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+    items = sale_items(size)
+
+    try:
+        started = time.perf_counter()
+        for item in items:
+            async with sessions() as db:
+                await db_sales.create_sale(SaleBase.model_validate(item), db, user_id)
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        async with sessions() as db:
+            await db_sales.create_sales(items, db, user_id)
+        batch = time.perf_counter() - started
+    finally:
+        await engine.dispose()
+
+    return single, batch
+
+
+def benchmark(sizes=BATCH_SIZES):
+    """Returns a list of (size, single seconds, batch seconds)."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'batch.db')}"
+        user_id = seed_user(url, True)
+        for size in sizes:
+            single, batch = asyncio.run(time_paths(url, user_id, size))
+            results.append((size, single, batch))
+
+    return results
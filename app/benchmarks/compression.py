@@ -0,0 +1,97 @@
+"""Bytes saved and latency added by middleware.compression.
+
+Every payload is served through CompressionMiddleware with the configured
+levels, for a client accepting nothing (identity), gzip and Brotli: a page
+and the whole of a sale listing as one JSON body, and the CSV export of the
+same sales streamed in its batches. The added latency is the time to serve
+the payload minus that of identity; the transfer is the added latency plus
+the time the compressed bytes take over a link of `mbps` megabits per
+second, as a shop on a mobile connection would see it.
+
+The ASGI apps are called directly, so no server or network is involved.
+"""
+import asyncio
+import time
+
+from starlette.responses import Response, StreamingResponse
+
+from benchmarks.asgi import fetch
+from benchmarks.seeding import sale_rows
+from database.db_sales import EXPORT_FIELDS
+from database.export import EXPORT_BATCH_SIZE, csv_encoder
+from middleware.compression import CompressionMiddleware
+from routers.responses import model_list_response
+from schema.schemas import SaleDisplay
+
+ROWS = 10_000
+PAGE_ROWS = 100
+RUNS = 5
+MBPS = 2.0
+
+ENCODINGS = ("identity", "gzip", "br")
+
+
+def body_app(body: bytes, media_type: str):
+    async def app(scope, receive, send):
+        await Response(body, media_type=media_type)(scope, receive, send)
+    return app
+
+
+def stream_app(chunks, media_type: str):
+    async def app(scope, receive, send):
+        await StreamingResponse(iter(chunks), media_type=media_type)(scope, receive, send)
+    return app
+
+
+def payloads(rows: int):
+    sales = sale_rows(rows)
+    encode = csv_encoder(EXPORT_FIELDS)
+    chunks = [
+        encode([[getattr(sale, field) for field in EXPORT_FIELDS]
+                for sale in sales[start:start + EXPORT_BATCH_SIZE]])
+        for start in range(0, rows, EXPORT_BATCH_SIZE)
+    ]
+
+    return {
+        f"json {PAGE_ROWS} rows": body_app(
+            model_list_response(SaleDisplay, sales[:PAGE_ROWS]).body, "application/json"
+        ),
+        f"json {rows} rows": body_app(
+            model_list_response(SaleDisplay, sales).body, "application/json"
+        ),
+        f"csv {rows} rows": stream_app(chunks, "text/csv"),
+    }
+
+
+async def serve(app, encoding: str, runs: int):
+    """Best time of `runs` requests and the body bytes sent."""
+    headers = [("accept-encoding", encoding)]
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        _, _, sent = await fetch(app, "/", headers)
+        best = min(best, time.perf_counter() - started)
+    return best, sent
+
+
+async def run(rows: int, runs: int, mbps: float):
+    results = []
+    for name, payload in payloads(rows).items():
+        app = CompressionMiddleware(payload)
+        baseline, plain = await serve(app, "identity", runs)
+        for encoding in ENCODINGS:
+            if encoding == "identity":
+                seconds, sent = baseline, plain
+            else:
+                seconds, sent = await serve(app, encoding, runs)
+            added = seconds - baseline
+            transfer = added + sent * 8 / (mbps * 1e6)
+            results.append((name, encoding, sent, 1 - sent / plain, added, transfer))
+
+    return results
+
+
+def benchmark(rows: int = ROWS, runs: int = RUNS, mbps: float = MBPS):
+    """Returns a list of (payload, encoding, bytes sent, fraction saved,
+    seconds added, seconds to transfer at `mbps`)."""
+    return asyncio.run(run(rows, runs, mbps))
@@ -0,0 +1,134 @@
+"""Avatar serving before and after routers.static.ImageFiles.
+
+Before: the original upload under its reused name, images/{username}.png,
+and an svg logo, through a plain StaticFiles mount. Nothing tells the
+client how long it may keep them, so they are downloaded on every screen
+(no-cache) or, at best, revalidated with their ETag (revalidate).
+
+After: the 256px WebP thumbnail and the logo under their content hash
+through ImageFiles, the logo brotli-compressed. A client that honours
+Cache-Control downloads each file once (cache).
+
+The ASGI apps are called directly, so the throughput is that of the mounts
+alone, without a server or network in between.
+"""
+import asyncio
+import io
+import os
+import tempfile
+import time
+
+from PIL import Image
+from starlette.staticfiles import StaticFiles
+
+from benchmarks.asgi import fetch
+from jobs import images
+from routers.static import ImageFiles
+
+SCREEN_VIEWS = 50
+REQUESTS = 2000
+
+# how a client fetches an image it has shown before
+NO_CACHE, REVALIDATE, CACHE = "no-cache", "revalidate", "cache"
+
+LOGO = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 64 64">'
+    + b''.join(
+        b'<circle cx="%d" cy="%d" r="%d" fill="#%06x" stroke="#222" stroke-width="1"/>'
+        % (n * 7 % 64, n * 13 % 64, n % 9 + 2, n * 99991 % 0xFFFFFF)
+        for n in range(60)
+    )
+    + b'</svg>'
+)
+
+
+def photo(size=(1200, 900)):
+    """An upload with camera-like noise, so PNG cannot shrink it away."""
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 48)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def throughput(app, path: str, headers=(), requests: int = REQUESTS):
+    started = time.perf_counter()
+    for _ in range(requests):
+        await fetch(app, path, headers)
+    return requests / (time.perf_counter() - started)
+
+
+async def screens(app, paths, views: int, client: str, headers=()):
+    """Requests made and body bytes transferred by a `client` showing
+    `paths` on `views` screens."""
+    cached = {}
+    transferred = requests = 0
+    for _ in range(views):
+        for path in paths:
+            kept = cached.get(path, {})
+            if client == CACHE and "immutable" in kept.get("cache-control", ""):
+                continue
+            request_headers = list(headers)
+            if client != NO_CACHE and "etag" in kept:
+                request_headers.append(("if-none-match", kept["etag"]))
+            status, response_headers, body = await fetch(app, path, request_headers)
+            requests += 1
+            transferred += body
+            if status == 200:
+                cached[path] = response_headers
+    return requests, transferred
+
+
+async def run(directory: str, views: int, requests: int):
+    before_app = StaticFiles(directory=directory)
+    after_app = ImageFiles(directory=directory)
+
+    upload = photo()
+    with open(os.path.join(directory, "alice.png"), "wb") as file:
+        file.write(upload)
+    with open(os.path.join(directory, "logo.svg"), "wb") as file:
+        file.write(LOGO)
+
+    # what an upload goes through now, see jobs.images
+    os.makedirs(os.path.join(directory, "1"))
+    original = os.path.join(directory, "1", f"{'a' * 64}.png")
+    with open(original, "wb") as file:
+        file.write(upload)
+    avatar = images.make_thumbnails(original)["user_image_medium_url"]
+    logo = os.path.join(directory, "1", f"{'b' * 64}.svg")
+    with open(logo, "wb") as file:
+        file.write(LOGO)
+    images.precompress(logo, "svg")
+
+    accept = [("accept-encoding", "gzip, deflate, br")]
+    before_paths = ["/alice.png", "/logo.svg"]
+    after_paths = ["/" + os.path.relpath(path, directory) for path in (avatar, logo)]
+
+    return {
+        "before": {
+            "avatar_rps": await throughput(before_app, before_paths[0], accept, requests),
+            "logo_rps": await throughput(before_app, before_paths[1], accept, requests),
+            "screens": {
+                client: await screens(before_app, before_paths, views, client, accept)
+                for client in (NO_CACHE, REVALIDATE)
+            },
+        },
+        "after": {
+            "avatar_rps": await throughput(after_app, after_paths[0], accept, requests),
+            "logo_rps": await throughput(after_app, after_paths[1], accept, requests),
+            "revalidate_rps": await throughput(
+                after_app, after_paths[0],
+                accept + [("if-none-match", f'"{"a" * 64}_256"')], requests,
+            ),
+            "screens": {
+                client: await screens(after_app, after_paths, views, client, accept)
+                for client in (REVALIDATE, CACHE)
+            },
+        },
+    }
+
+
+def benchmark(views: int = SCREEN_VIEWS, requests: int = REQUESTS):
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(directory, views, requests))
@@ -0,0 +1,102 @@
+"""CPU and memory of the sale listing read paths.
+
+Compares the ORM path the listings used before (Sale objects with their
+user selectin loaded, read back by SaleDisplay through from_attributes)
+with the column projection of db_sales.user_sales_select and sale_rows,
+on a throwaway SQLite file.
+
+CPU is process time per row, so the driver's thread counts too, for the
+fetch alone and for the fetch plus the SaleDisplay validation the routes
+run. Memory is the tracemalloc peak per row while fetching, measured in a
+separate run so its overhead does not skew the timing.
+"""
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from benchmarks.seeding import seed_sales, seed_user
+from database import db_sales
+from database.database import make_async_engine
+from database.models import Sale, User
+from schema.schemas import SaleDisplay
+
+ROW_COUNTS = (10_000, 100_000)
+
+
+async def orm_rows(db: AsyncSession, user_id: int):
+    statement = (
+        select(Sale)
+        .where(Sale.user_id == user_id)
+        .options(selectinload(Sale.user).load_only(User.id, User.username, User.email))
+        .order_by(Sale.sold_on.desc(), Sale.id.desc())
+    )
+    return (await db.scalars(statement)).all()
+
+
+async def projected_rows(db: AsyncSession, user_id: int):
+    statement = db_sales.user_sales_select(user_id).order_by(Sale.sold_on.desc(), Sale.id.desc())
+    return await db_sales.sale_rows(db, statement)
+
+
+PATHS = {"orm": orm_rows, "projection": projected_rows}
+
+
+def serialise(rows):
+    return [SaleDisplay.model_validate(row, from_attributes=True) for row in rows]
+
+
+async def cpu_seconds(engine, read, user_id: int, validate: bool):
+    async with AsyncSession(engine) as db:
+        started = time.process_time()
+        rows = await read(db, user_id)
+        if validate:
+            serialise(rows)
+        return time.process_time() - started
+
+
+async def peak_bytes(engine, read, user_id: int):
+    async with AsyncSession(engine) as db:
+        tracemalloc.start()
+        try:
+            await read(db, user_id)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return peak
+
+
+async def measure(url: str, user_id: int, rows: int):
+    engine = make_async_engine(url)
+    results = []
+    try:
+        for name, read in PATHS.items():
+            # warm the statement caches and the file pages
+            await cpu_seconds(engine, read, user_id, False)
+            fetch = await cpu_seconds(engine, read, user_id, False)
+            total = await cpu_seconds(engine, read, user_id, True)
+            peak = await peak_bytes(engine, read, user_id)
+            results.append((rows, name, fetch / rows * 1e6, total / rows * 1e6, peak / rows))
+    finally:
+        await engine.dispose()
+
+    return results
+
+
+def benchmark(row_counts=ROW_COUNTS):
+    """Returns a list of (rows, path, fetch us/row, fetch and validate
+    us/row, peak bytes/row)."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in row_counts:
+            url = f"sqlite:///{os.path.join(directory, f'read{rows}.db')}"
+            user_id = seed_user(url, True)
+            seed_sales(url, user_id, rows)
+            results.extend(asyncio.run(measure(url, user_id, rows)))
+
+    return results
@@ -0,0 +1,72 @@
+"""Encoding time and allocations of a large listing response.
+
+Encodes the same rows as list[SaleDisplay] the way FastAPI does for a
+response_model (validate, convert to plain Python data, json.dumps through
+JSONResponse) and through routers.responses.model_list_response. The rows
+are SaleRow tuples like db_sales returns; no database is involved.
+
+Time is the best of several runs; memory is the tracemalloc peak of a
+separate run, so its overhead does not skew the timing.
+"""
+import asyncio
+import time
+import tracemalloc
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.seeding import sale_rows
+from routers.responses import model_list_response
+from schema.schemas import SaleDisplay
+
+ROWS = 10_000
+RUNS = 5
+
+
+def default_encoder():
+    field = create_response_field(name="response", type_=list[SaleDisplay])
+
+    def encode(rows):
+        content = asyncio.run(
+            serialize_response(field=field, response_content=rows, is_coroutine=True)
+        )
+        return JSONResponse(content).body
+
+    return encode
+
+
+def fast_encoder(rows):
+    return model_list_response(SaleDisplay, rows).body
+
+
+def measure(encode, rows, runs: int):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = encode(rows)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        encode(rows)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": best, "peak_bytes": peak, "bytes": len(body),
+            "body": body}
+
+
+def benchmark(rows: int = ROWS, runs: int = RUNS):
+    """Returns {encoder name: measurements}; both bodies are checked to be
+    the same JSON."""
+    sales = sale_rows(rows)
+    results = {
+        "fastapi": measure(default_encoder(), sales, runs),
+        "dump_json": measure(fast_encoder, sales, runs),
+    }
+    if results["fastapi"]["body"] != results["dump_json"]["body"]:
+        raise AssertionError("The encoders disagree on the response body.")
+
+    return results
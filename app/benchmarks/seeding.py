@@ -0,0 +1,76 @@
+"""Scratch data shared by the benchmarks and the stress test.
+
+seed_user, seed_sales and seed_expenditures write to a throwaway database
+at `url`; sale_rows builds SaleRow tuples in memory, shaped like the
+listings of db_sales.
+"""
+import datetime
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from database import migrations
+from database.database import make_engine
+from database.db_sales import SaleRow, UserRow
+from database.models import Expenditure, Sale, User
+
+
+def seed_user(url: str, tuned: bool = True):
+    """Create the schema at `url` and a user to own the seeded rows;
+    returns the user id."""
+    engine = make_engine(url, tuned)
+    migrations.upgrade(engine)
+    with Session(engine) as db:
+        username = f"bench{time.time_ns()}"
+        # emails are unique, and statements print the user's names
+        user = User(username=username, email=f"{username}@casher.app", first_name="Bench",
+                    last_name="Mark", user_type="user")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+
+    return user_id
+
+
+def seed_sales(url: str, user_id: int, rows: int):
+    engine = make_engine(url)
+    first = datetime.date(2023, 1, 1)
+    with Session(engine) as db:
+        db.execute(insert(Sale), [
+            dict(item=f"item{n}", bought_amount=100, sell_amount=150,
+                 mode_of_payment="cash", transaction_code="", balance=n % 2 * 10,
+                 profit=50 - n % 2 * 10, description="",
+                 sold_on=first + datetime.timedelta(days=n % 365), user_id=user_id,
+                 created_on=datetime.datetime.now())
+            for n in range(rows)
+        ])
+        db.commit()
+    engine.dispose()
+
+
+def seed_expenditures(url: str, user_id: int, rows: int):
+    engine = make_engine(url)
+    first = datetime.datetime(2023, 1, 1, 8)
+    with Session(engine) as db:
+        db.execute(insert(Expenditure), [
+            dict(money_type="credit" if n % 4 == 0 else "expense", amount=100 + n % 50,
+                 paid_on=(first + datetime.timedelta(hours=n)).date().isoformat(),
+                 description=f"expense {n}", user_id=user_id,
+                 time_stamp=first + datetime.timedelta(hours=n))
+            for n in range(rows)
+        ])
+        db.commit()
+    engine.dispose()
+
+
+def sale_rows(count: int):
+    user = UserRow(1, "alice01", "alice@casher.app")
+    now = datetime.datetime.now()
+    return [
+        SaleRow(n, f"item{n}", 100, 150, "mobile money", f"QX{n:08d}", n % 2 * 10,
+                50 - n % 2 * 10, "", datetime.date(2023, 1, 1) + datetime.timedelta(days=n % 365),
+                1, now, user)
+        for n in range(count)
+    ]
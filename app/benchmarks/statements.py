@@ -0,0 +1,77 @@
+"""Peak memory of expenditure statement rendering.
+
+Seeds ledgers of ROW_COUNTS expenditures on throwaway SQLite files and
+renders each with db_expenditure.expenditures_to_pdf, the way the statement
+worker does. Every render runs in a fresh spawned process, so its peak
+resident set, resource.getrusage's ru_maxrss, is its own: the baseline is
+taken once WeasyPrint and pypdf are imported, the peak after the PDF is
+written. Linux carries the parent's peak over into a child it starts, so
+the ledgers are seeded by a spawned process of their own too.
+
+As statement.render_pdf lays out one chunk at a time, the peak of a large
+ledger should stay close to that of a small one.
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.seeding import seed_expenditures, seed_user
+
+ROW_COUNTS = (1_000, 50_000)
+BUDGET_MB = 400
+
+
+def maxrss_mb():
+    # kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def seed(url: str, rows: int):
+    user_id = seed_user(url)
+    seed_expenditures(url, user_id, rows)
+    return user_id
+
+
+def render(url: str, user_id: int, file_path: str):
+    """Runs in the spawned process; returns (seconds, baseline MB, peak MB)."""
+    # imported before the baseline, so it counts their memory and no rows
+    import pypdf
+    import weasyprint
+    from sqlalchemy.orm import Session
+
+    from database import db_expenditure
+    from database.database import make_engine
+
+    baseline = maxrss_mb()
+    engine = make_engine(url)
+    started = time.perf_counter()
+    with Session(engine) as db:
+        db_expenditure.expenditures_to_pdf(db, user_id, file_path)
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    return elapsed, baseline, maxrss_mb()
+
+
+def benchmark(row_counts=ROW_COUNTS):
+    """Yields (rows, pages, seconds, baseline MB, peak MB, PDF bytes) per
+    ledger size."""
+    from pypdf import PdfReader
+
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in row_counts:
+            url = f"sqlite:///{os.path.join(directory, f'{rows}.db')}"
+            file_path = os.path.join(directory, f"{rows}.pdf")
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                user_id = pool.submit(seed, url, rows).result()
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                elapsed, baseline, peak = pool.submit(render, url, user_id, file_path).result()
+
+            pages = len(PdfReader(file_path).pages)
+            yield rows, pages, elapsed, baseline, peak, os.path.getsize(file_path)
@@ -0,0 +1,112 @@
+"""Concurrent write stress test for the database engine profiles.
+
+Runs the same workload once with SQLAlchemy's default engine options and
+once with the tuned profile of database.engine_options: several asyncio
+writers record sales the way db_sales.create_sale does (a sale insert and a
+rollup upsert in one transaction) while readers page through the sales.
+
+Lock waits are not reported by SQLite, so they are estimated: a single
+writer first measures the uncontended latency of a write, and whatever a
+contended write takes beyond that is counted as waiting for the lock.
+"""
+import asyncio
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.seeding import seed_user
+from database import db_sales
+from database.database import make_async_engine
+from database.models import Sale
+
+PROFILES = {"default": False, "tuned": True}
+
+
+async def record_sale(sessions, user_id: int, n: int):
+    day = datetime.date(2023, 1, 1) + datetime.timedelta(days=n % 365)
+    async with sessions() as db:
+        sale = Sale(item="stress", bought_amount=100, sell_amount=150,
+                    mode_of_payment="cash", transaction_code="", balance=0,
+                    profit=50, description="", sold_on=day, user_id=user_id,
+                    created_on=datetime.datetime.now())
+        db.add(sale)
+        await db_sales.update_daily_rollup(db, user_id, day, [sale])
+        await db.commit()
+
+
+async def writer(sessions, user_id: int, writes: int, latencies: list, errors: list):
+    for n in range(writes):
+        started = time.perf_counter()
+        try:
+            await record_sale(sessions, user_id, n)
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+
+async def reader(sessions, user_id: int, done: asyncio.Event, reads: list):
+    while not done.is_set():
+        async with sessions() as db:
+            await db_sales.user_sales(db, user_id, 50)
+        reads.append(1)
+
+
+async def run_profile(url: str, tuned: bool, writers: int, writes: int, readers: int):
+    user_id = seed_user(url, tuned)
+    engine = make_async_engine(url, tuned)
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    try:
+        baseline = []
+        await writer(sessions, user_id, 20, baseline, [])
+        uncontended = statistics.median(baseline)
+
+        latencies, errors, reads = [], [], []
+        done = asyncio.Event()
+        reading = [
+            asyncio.create_task(reader(sessions, user_id, done, reads))
+            for _ in range(readers)
+        ]
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            writer(sessions, user_id, writes, latencies, errors)
+            for _ in range(writers)
+        ])
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*reading)
+    finally:
+        await engine.dispose()
+
+    waits = [max(0.0, latency - uncontended) for latency in latencies]
+    latencies.sort()
+
+    return {
+        "writes": len(latencies),
+        "errors": len(errors),
+        "writes_per_second": len(latencies) / elapsed,
+        "reads_per_second": len(reads) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "lock_wait_ms_avg": statistics.fmean(waits) * 1000 if waits else 0.0,
+        "lock_wait_s_total": sum(waits),
+    }
+
+
+def stress(url: str = None, profiles=PROFILES, writers: int = 8, writes: int = 100,
+           readers: int = 2):
+    """Returns {profile name: results}. Without `url` every profile runs on
+    its own throwaway SQLite file."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in profiles:
+            profile_url = url or f"sqlite:///{os.path.join(directory, f'{name}.db')}"
+            results[name] = asyncio.run(
+                run_profile(profile_url, PROFILES[name], writers, writes, readers)
+            )
+
+    return results
@@ -0,0 +1,152 @@
+"""Per-request validation cost of sales and expenditures.
+
+Compares the validation the routes ran before, a schema of plain strings
+followed by correct_sale / correct_expenditure parsing the dates by hand,
+with the typed SaleBase and ExpenditureBase that pydantic-core validates
+alone. Both parse the same JSON body the web client sends.
+
+The old correct_sale printed debug banners on every request; they are
+written to os.devnull here, so their cost is counted without a terminal
+or log file behind them. Time is the best of several runs.
+"""
+import contextlib
+import datetime
+import os
+import time
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+from schema.schemas import ExpenditureBase, SaleBase
+
+REQUESTS = 10_000
+RUNS = 5
+
+SALE_JSON = (
+    b'{"item": "sugar 1kg", "bought_amount": 100, "sell_amount": 150, '
+    b'"mode_of_payment": "Mobile Money", "transaction_code": "QX12345678", '
+    b'"balance": 0, "description": "", "sold_on": "2023-05-04T21:00:00.000Z"}'
+)
+EXPENDITURE_JSON = (
+    b'{"money_type": "Expense", "amount": 250.5, "description": "rent", '
+    b'"paid_on": "2023-05-04T21:00:00.000Z"}'
+)
+
+
+class OldSaleBase(BaseModel):
+    item: str
+    bought_amount: int
+    sell_amount: int
+    mode_of_payment: str
+    transaction_code: str
+    balance: int
+    description: str
+    sold_on: str
+
+
+class OldExpenditureBase(BaseModel):
+    money_type: str
+    amount: float
+    paid_on: str
+    description: str
+
+
+def old_ledger_date(value: str, next_day: bool = False):
+    """The hand-rolled date checks shared by correct_sale and
+    correct_expenditure."""
+    paid_on = value.split("T")[0].split("-")
+
+    if len(paid_on) != 3:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Enter the date as DD-MM-YYYY.")
+
+    paid_on_dates = [paid_on[0], paid_on[1], paid_on[2][:2]]
+    for d in paid_on_dates:
+        try:
+            int(d)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                                detail=f"Invalid dates ->  {paid_on_dates}.")
+
+    if int(paid_on[0]) > 2023 or int(paid_on[0]) < 2022:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Invalid calendar Month.")
+    if int(paid_on[1]) < 1 or int(paid_on[1]) > 12:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Invalid calendar Month.")
+    if int(paid_on[2]) > 31 or int(paid_on[2]) < 1:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Invalid date of the month.")
+
+    day = int(paid_on[2]) + 1 if next_day else int(paid_on[2])
+    return datetime.datetime.strptime(f"{paid_on[0]}-{paid_on[1]}-{day}", "%Y-%m-%d").date()
+
+
+def correct_sale(request: OldSaleBase):
+    if request.item == "":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Kindly select what you sold.")
+    if request.bought_amount < 0 or request.sell_amount < 0 or request.balance < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Sell and bought amount must be greater than zero.")
+    if request.mode_of_payment.lower() not in ["cash", "mobile money", "gift"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Mode of payment may either be `cash`, `mobile money`, `gift`.")
+    if request.sell_amount == 0 and request.mode_of_payment != "gift":
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                            detail=f"I have noticed you sold this {request.item} at 0 price.")
+
+    print("**********************************\n\n")
+    print(request.sold_on.split("T"))
+    print("**********************************\n\n")
+
+    return old_ledger_date(request.sold_on, next_day=True)
+
+
+def correct_expenditure(request: OldExpenditureBase):
+    if request.money_type.lower() not in ["credit", "expense"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Type must either be credit or expense.")
+    if request.amount < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Was {request.amount} a loan?")
+
+    return request.money_type.lower(), old_ledger_date(request.paid_on)
+
+
+PATHS = {
+    "sale": (
+        lambda body: correct_sale(OldSaleBase.model_validate_json(body)),
+        SaleBase.model_validate_json,
+        SALE_JSON,
+    ),
+    "expenditure": (
+        lambda body: correct_expenditure(OldExpenditureBase.model_validate_json(body)),
+        ExpenditureBase.model_validate_json,
+        EXPENDITURE_JSON,
+    ),
+}
+
+
+def best_seconds(validate, body: bytes, requests: int, runs: int):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        for _ in range(requests):
+            validate(body)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmark(requests: int = REQUESTS, runs: int = RUNS):
+    """Returns a list of (schema, before us/request, after us/request)."""
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, (before, after, body) in PATHS.items():
+            results.append((
+                name,
+                best_seconds(before, body, requests, runs) / requests * 1e6,
+                best_seconds(after, body, requests, runs) / requests * 1e6,
+            ))
+
+    return results
@@ -0,0 +1,47 @@
+"""Per-user data versions, for conditional GETs.
+
+Every write to a user's sales or expenditures adds 1 to the user's row in
+data_version, in the same transaction as the write. routers.conditional
+reads the version before the route's queries run (on SQLite in a separate
+implicit transaction), so a write may commit in between: the data of a
+response can be newer than the version it is named by, never older. A body
+cached under the current ETag therefore holds at least the data of that
+version and is never stale; at worst a client fetches data it already has
+once more. This is what lets If-None-Match be answered without running the
+queries. Users who never wrote anything have no row and are at version 0.
+"""
+from sqlalchemy import literal, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import DIALECT_INSERTS
+from .models import DataVersion, User
+
+
+def bump_statement(dialect: str, user_id: int = None):
+    """The upsert adding 1 to the version of `user_id`, or of every user
+    when it is None (after a rebuild of the ledgers)."""
+    insert = DIALECT_INSERTS[dialect]
+    if user_id is None:
+        # SQLite needs a WHERE before the upsert clause of INSERT ... SELECT
+        statement = insert(DataVersion).from_select(
+            ["user_id", "version"], select(User.id, literal(1)).where(true())
+        )
+    else:
+        statement = insert(DataVersion).values(user_id=user_id, version=1)
+
+    return statement.on_conflict_do_update(
+        index_elements=[DataVersion.user_id],
+        set_={"version": DataVersion.version + 1},
+    )
+
+
+async def bump(db: AsyncSession, user_id: int):
+    """Bump the version of `user_id` in the caller's transaction."""
+    await db.execute(bump_statement(db.bind.dialect.name, user_id))
+
+
+async def current(db: AsyncSession, user_id: int):
+    version = await db.scalar(
+        select(DataVersion.version).where(DataVersion.user_id == user_id)
+    )
+    return version or 0
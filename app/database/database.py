@@ -1,14 +1,107 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = 'sqlite:///./casher.db'
+SQLALCHEMY_DATABASE_URL = os.environ.get('CASHER_DATABASE_URL',
+                                         'sqlite:///./casher.db')
+
+# asyncio drivers for the synchronous URL's backend
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# SQLite profile, applied to every new connection. WAL lets readers run
+# alongside the single writer, NORMAL sync is durable across application
+# crashes under WAL, and busy_timeout makes a writer wait for the lock
+# instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('CASHER_SQLITE_BUSY_TIMEOUT_MS', 15000)),
+    'mmap_size': int(os.environ.get('CASHER_SQLITE_MMAP_MB', 256)) * 1024 * 1024,
+    # negative sizes are in KiB
+    'cache_size': -int(os.environ.get('CASHER_SQLITE_CACHE_MB', 64)) * 1024,
+}
+
+# PostgreSQL profile: a bounded connection pool per process, checked before
+# use, and a server-side limit on how long one statement may run
+POSTGRES_POOL = {
+    'pool_size': int(os.environ.get('CASHER_DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('CASHER_DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': int(os.environ.get('CASHER_DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.environ.get('CASHER_DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': True,
+}
+POSTGRES_STATEMENT_TIMEOUT_MS = int(
+    os.environ.get('CASHER_DB_STATEMENT_TIMEOUT_MS', 30000))
+
+
+def async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def engine_options(url, tuned: bool = True):
+    """create_engine keyword arguments of the profile for `url`'s backend.
+    `tuned=False` keeps SQLAlchemy's defaults, to compare against."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+
+    if backend == 'sqlite':
+        if url.get_driver_name() == 'aiosqlite':
+            return {}
+        return {'connect_args': {'check_same_thread': False}}
+
+    if backend == 'postgresql' and tuned:
+        if url.get_driver_name() == 'asyncpg':
+            connect_args = {'server_settings': {
+                'statement_timeout': str(POSTGRES_STATEMENT_TIMEOUT_MS)}}
+        else:
+            connect_args = {
+                'options': f'-c statement_timeout={POSTGRES_STATEMENT_TIMEOUT_MS}'}
+        return {**POSTGRES_POOL, 'connect_args': connect_args}
+
+    return {}
+
+
+def make_engine(url, tuned: bool = True):
+    engine = create_engine(url, **engine_options(url, tuned))
+    if tuned and engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+    return engine
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL,
-                       connect_args={"check_same_thread": False})
+
+def make_async_engine(url, tuned: bool = True):
+    url = async_url(url)
+    engine = create_async_engine(url, **engine_options(url, tuned))
+    if tuned and engine.dialect.name == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+
+# the synchronous engine serves the maintenance commands, migrations and
+# background workers; the API routes use the asyncio engine below
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+async_engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+
+# objects stay loaded after commit: the routes serialize them afterwards
+# and an expired attribute cannot be lazily refreshed under asyncio
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False,
+                                       expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -18,3 +111,32 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# the insert() with ON CONFLICT support of each backend
+DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def increment(db, model, key: dict, deltas: dict):
+    """Add `deltas` to the columns of the `model` row identified by `key`,
+    inserting the row when it does not exist yet.
+
+    Runs as a single upsert in the caller's transaction, so concurrent
+    writers never lose each other's updates.
+    """
+    insert = DIALECT_INSERTS[db.bind.dialect.name]
+
+    statement = insert(model).values(**key, **deltas)
+    statement = statement.on_conflict_do_update(
+        index_elements=[getattr(model, name) for name in key],
+        set_={
+            name: getattr(model, name) + getattr(statement.excluded, name)
+            for name in deltas
+        },
+    )
+    await db.execute(statement)
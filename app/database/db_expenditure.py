@@ -1,82 +1,28 @@
-import os
-
-import pandas as pd
-from weasyprint import HTML
-
 import datetime
+import math
+from collections import namedtuple
 
+from sqlalchemy import func, case, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
 
-from fastapi import HTTPException, status, Response
-
-from schema.schemas import ExpenditureBase
-from .models import Expenditure, User
-
-
-def correct_expenditure(request: ExpenditureBase):
-    money_type = ["credit", "expense"]
-
-    if request.money_type.lower() not in money_type:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Type must either be credit or expense.",
-        )
-    money_type = request.money_type.lower()
-
-    if request.amount < 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Was {request.amount} a loan? Record it as credit with a description of loan.",
-        )
-
-    paid_on_date = request.paid_on.split("T")
-    paid_on = paid_on_date[0].split("-")
-
-    if len(paid_on) != 3:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Enter the date as DD-MM-YYYY.",
-        )
-
-    paid_on_dates = [paid_on[0], paid_on[1], paid_on[2][:2]]
-
-    for d in paid_on_dates:
-        try:
-            int(d)
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Invalid dates ->  {paid_on_dates}.",
-            )
-
-    if int(paid_on[0]) > 2023 or int(paid_on[0]) < 2022:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid calendar Month."
-        )
-
-    if int(paid_on[1]) < 1 or int(paid_on[1]) > 12:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid calendar Month."
-        )
+from fastapi import HTTPException, status
 
-    if int(paid_on[2]) > 31 or int(paid_on[2]) < 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid date of the month."
-        )
+from schema.schemas import ExpenditureBase, ExpenditureDisplay
+from .database import increment
+from .models import Expenditure, ExpenditureBalance, User
+from .pagination import keyset_select, keyset_page, DEFAULT_PAGE_SIZE
+from .export import export_rows
+from . import data_version, statement
 
-    date_string = f"{paid_on[0]}-{paid_on[1]}-{paid_on[2]}"
-    paid_on = datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
 
-    return money_type, paid_on
-
-
-def create_expenditure(request: ExpenditureBase, db: Session, current_user_id: int):
-    money_type, paid_on = correct_expenditure(request)
+async def create_expenditure(request: ExpenditureBase, db: AsyncSession, current_user_id: int):
+    money_type = request.money_type.value
 
     new_expenditure = Expenditure(
         money_type=money_type,
         amount=request.amount,
-        paid_on=paid_on,
+        paid_on=request.paid_on.isoformat(),
         description=request.description,
         user_id=current_user_id,
         time_stamp=datetime.datetime.now(),
@@ -91,8 +37,9 @@ def create_expenditure(request: ExpenditureBase, db: Session, current_user_id: i
 
     try:
         db.add(new_expenditure)
-        db.commit()
-        db.refresh(new_expenditure)
+        await update_balance(db, current_user_id, money_type, request.amount)
+        await data_version.bump(db, current_user_id)
+        await db.commit()
         return new_expenditure
     except Exception as e:
         raise HTTPException(
@@ -101,23 +48,70 @@ def create_expenditure(request: ExpenditureBase, db: Session, current_user_id: i
         )
 
 
-def user_expenditures(db: Session, current_user_id: int):
-    expenditures = (
-        db.query(Expenditure)
-        .filter(Expenditure.user_id == current_user_id)
-        .order_by(Expenditure.time_stamp.desc())
-        .all()
+# the listing is read only: it selects the columns of ExpenditureDisplay
+# into these tuples instead of hydrating and tracking Expenditure objects
+ExpenditureRow = namedtuple("ExpenditureRow", ExpenditureDisplay.model_fields)
+
+
+async def user_expenditures(
+    db: AsyncSession, current_user_id: int, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None
+):
+    """One page of the user's expenditures, most recent first, and the
+    cursor of the next page (None on the last page)."""
+    statement = keyset_select(
+        select(*[getattr(Expenditure, field) for field in ExpenditureRow._fields])
+        .where(Expenditure.user_id == current_user_id),
+        Expenditure.time_stamp,
+        Expenditure.id,
+        limit,
+        cursor,
+        datetime.datetime.fromisoformat,
     )
+    expenditures = list(map(ExpenditureRow._make, await db.execute(statement)))
+
+    return keyset_page(expenditures, Expenditure.time_stamp, Expenditure.id, limit)
+
 
-    return expenditures
+EXPORT_FIELDS = ["id", "money_type", "amount", "paid_on", "description", "time_stamp"]
 
 
-def delete_expenditure(expend_id: int, db: Session, current_user_id: int):
-    expenditure = db.query(Expenditure).filter(Expenditure.id == expend_id).first()
+def export_expenditures(
+    db: AsyncSession,
+    current_user_id: int,
+    export_format: str,
+    start: datetime.date = None,
+    end: datetime.date = None,
+    gzip: bool = False,
+):
+    """Stream the user's expenditures paid between `start` and `end`
+    (inclusive, either may be omitted) as CSV or NDJSON byte chunks, in the
+    order they were recorded."""
+    statement = (
+        select(*[getattr(Expenditure, field) for field in EXPORT_FIELDS])
+        .where(Expenditure.user_id == current_user_id)
+        .order_by(Expenditure.time_stamp, Expenditure.id)
+    )
+    # paid_on holds ISO dates, which compare correctly as strings
+    if start:
+        statement = statement.where(Expenditure.paid_on >= start.isoformat())
+    if end:
+        statement = statement.where(Expenditure.paid_on <= end.isoformat())
+
+    return export_rows(db, statement, EXPORT_FIELDS, export_format, gzip)
+
+
+async def delete_expenditure(expend_id: int, db: AsyncSession, current_user_id: int):
+    # locked, so a concurrent edit or delete cannot take the same amount
+    # back out of the balance (a no-op on SQLite, where writers serialise)
+    expenditure = await db.get(Expenditure, expend_id, with_for_update=True)
     if expenditure:
         if expenditure.user_id == current_user_id:
-            db.delete(expenditure)
-            db.commit()
+            await db.delete(expenditure)
+            await update_balance(
+                db, current_user_id, expenditure.money_type, -expenditure.amount
+            )
+            await data_version.bump(db, current_user_id)
+            await db.commit()
         else:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -130,10 +124,12 @@ def delete_expenditure(expend_id: int, db: Session, current_user_id: int):
         )
 
 
-def edit_expenditure(
-    request: ExpenditureBase, expend_id: int, db: Session, current_user_id: int
+async def edit_expenditure(
+    request: ExpenditureBase, expend_id: int, db: AsyncSession, current_user_id: int
 ):
-    expenditure = db.query(Expenditure).filter(Expenditure.id == expend_id).first()
+    # the old amount comes back out of the balance: lock the row until the
+    # commit, as in delete_expenditure
+    expenditure = await db.get(Expenditure, expend_id, with_for_update=True)
 
     if not expenditure:
         raise HTTPException(
@@ -147,18 +143,21 @@ def edit_expenditure(
             detail=f"You are not authorized to edit this " f"expenditure.",
         )
 
-    money_type, paid_on = correct_expenditure(request)
+    money_type = request.money_type.value
+
+    await update_balance(db, current_user_id, expenditure.money_type, -expenditure.amount)
+    await update_balance(db, current_user_id, money_type, request.amount)
 
     expenditure.money_type = money_type
-    expenditure.paid_on = paid_on
+    expenditure.paid_on = request.paid_on.isoformat()
     expenditure.amount = request.amount
     expenditure.description = request.description
     expenditure.time_stamp = datetime.datetime.now()
 
     try:
         db.add(expenditure)
-        db.commit()
-        db.refresh(expenditure)
+        await data_version.bump(db, current_user_id)
+        await db.commit()
         return expenditure
     except Exception as e:
         raise HTTPException(
@@ -167,157 +166,205 @@ def edit_expenditure(
         )
 
 
-def total_transactions(db: Session, current_user_id: int):
-    expenditures = (
-        db.query(Expenditure).filter(Expenditure.user_id == current_user_id).all()
+async def update_balance(db: AsyncSession, user_id: int, money_type: str, amount: float):
+    """Add `amount` of `money_type` to the user's expenditure_balance row, in
+    the caller's transaction. Pass a negative amount to take it back out."""
+    if money_type == "credit":
+        deltas = {"total_credits": amount, "total_expenses": 0, "money_at_hand": amount}
+    else:
+        deltas = {"total_credits": 0, "total_expenses": amount, "money_at_hand": -amount}
+
+    await increment(db, ExpenditureBalance, {"user_id": user_id}, deltas)
+
+
+def raw_balances(db: Session, user_id: int = None):
+    """The expenditure_balance rows recomputed from the raw expenditure table."""
+    credits = func.sum(case((Expenditure.money_type == "credit", Expenditure.amount), else_=0))
+    expenses = func.sum(case((Expenditure.money_type == "credit", 0), else_=Expenditure.amount))
+
+    query = db.query(
+        Expenditure.user_id, credits, expenses, credits - expenses
+    ).group_by(Expenditure.user_id)
+
+    if user_id is not None:
+        query = query.filter(Expenditure.user_id == user_id)
+
+    return query
+
+
+def rebuild_balances(db: Session, user_id: int = None):
+    """Recreate expenditure_balance from the raw expenditure rows.
+
+    Returns the number of balance rows written.
+    """
+    clear = db.query(ExpenditureBalance)
+    if user_id is not None:
+        clear = clear.filter(ExpenditureBalance.user_id == user_id)
+    clear.delete(synchronize_session=False)
+
+    rows = 0
+    for user, total_credits, total_expenses, money_at_hand in raw_balances(db, user_id):
+        db.add(
+            ExpenditureBalance(
+                user_id=user,
+                total_credits=total_credits,
+                total_expenses=total_expenses,
+                money_at_hand=money_at_hand,
+            )
+        )
+        rows += 1
+    db.execute(data_version.bump_statement(db.get_bind().dialect.name, user_id))
+    db.commit()
+
+    return rows
+
+
+def verify_balances(db: Session, user_id: int = None):
+    """Compare expenditure_balance with the raw expenditure rows.
+
+    Returns a list of (user_id, expected, found) tuples, one per drifted
+    user, where expected and found are (total_credits, total_expenses,
+    money_at_hand) tuples (zeros when the row is missing).
+    """
+    expected = {row[0]: tuple(row[1:]) for row in raw_balances(db, user_id)}
+
+    query = db.query(
+        ExpenditureBalance.user_id,
+        ExpenditureBalance.total_credits,
+        ExpenditureBalance.total_expenses,
+        ExpenditureBalance.money_at_hand,
     )
+    if user_id is not None:
+        query = query.filter(ExpenditureBalance.user_id == user_id)
+    found = {row[0]: tuple(row[1:]) for row in query}
 
-    credits = []
-    expenses = []
+    drift = []
+    for user in sorted(expected.keys() | found.keys()):
+        want = expected.get(user, (0, 0, 0))
+        have = found.get(user, (0, 0, 0))
+        # amounts are floats, so running sums may be off by rounding only
+        if not all(math.isclose(a, b, abs_tol=0.005) for a, b in zip(want, have)):
+            drift.append((user, want, have))
+
+    return drift
+
+
+async def total_transactions(db: AsyncSession, current_user_id: int):
+    return balance_totals(await db.get(ExpenditureBalance, current_user_id))
 
-    for expend in expenditures:
-        if expend.money_type == "credit":
-            credits.append(expend.amount)
-        else:
-            expenses.append(expend.amount)
 
-    total_credits = sum(credits)
-    total_expenses = sum(expenses)
-    total_transaction = sum(credits) + sum(expenses)
-    money_at_hand = sum(credits) - sum(expenses)
+def balance_totals(balance: ExpenditureBalance):
+    if not balance:
+        return (0, 0, 0, 0)
+
+    total_credits = balance.total_credits
+    total_expenses = balance.total_expenses
+    total_transaction = total_credits + total_expenses
+    money_at_hand = balance.money_at_hand
 
     return (total_credits, total_expenses, total_transaction, money_at_hand)
 
 
-def expenditures_to_pdf(db: Session, current_user_id: int, response: Response):
-    expenditures = (
-        db.query(Expenditure)
+# bump whenever the statement layout changes, so cached PDFs are not reused
+STATEMENT_TEMPLATE_VERSION = 2
+
+
+def statement_version(db: Session, current_user_id: int):
+    """Everything a statement's content depends on, read with one aggregate
+    query: any expenditure added, edited or deleted changes the count, the
+    latest time_stamp or the totals."""
+    count, latest, total = (
+        db.query(
+            func.count(Expenditure.id),
+            func.max(Expenditure.time_stamp),
+            func.sum(Expenditure.amount),
+        )
         .filter(Expenditure.user_id == current_user_id)
-        .order_by(Expenditure.time_stamp.desc())
-        .all()
+        .one()
+    )
+    user = db.get(User, current_user_id)
+
+    return (
+        STATEMENT_TEMPLATE_VERSION,
+        current_user_id,
+        user.username,
+        user.first_name,
+        user.last_name,
+        count,
+        str(latest),
+        total,
     )
 
-    user = db.query(User).filter(User.id == current_user_id).first()
-
-    list_of_expenditures = [
-        {
-            "Money Type": expenditure.money_type,
-            "Amount": expenditure.amount,
-            "Paid On": expenditure.paid_on,
-            "Description": expenditure.description,
-            "Time Created": expenditure.time_stamp,
-        }
-        for expenditure in expenditures
-    ]
 
-    if not list_of_expenditures:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="You have no expenses, create an expenditure to get statement.",
+def statement_chunks(db: Session, current_user_id: int):
+    """The user's expenditures as lists of statement rows, most recent
+    first. Every chunk is its own short keyset query, so no cursor stays
+    open while a chunk is laid out."""
+    rows_select = select(
+        Expenditure.money_type,
+        Expenditure.amount,
+        Expenditure.paid_on,
+        Expenditure.description,
+        Expenditure.time_stamp,
+        Expenditure.id,
+    ).where(Expenditure.user_id == current_user_id)
+    limit = statement.STATEMENT_CHUNK_ROWS
+
+    cursor = None
+    while True:
+        page = keyset_select(
+            rows_select,
+            Expenditure.time_stamp,
+            Expenditure.id,
+            limit,
+            cursor,
+            datetime.datetime.fromisoformat,
         )
+        rows, cursor = keyset_page(
+            db.execute(page).all(), Expenditure.time_stamp, Expenditure.id, limit
+        )
+        yield rows
+        if not cursor:
+            return
 
-    df = pd.DataFrame(list_of_expenditures)
 
-    # creating readable time_stamps
+def expenditures_to_pdf(db: Session, current_user_id: int, file_path: str, progress=None):
+    """Render the user's expenditure statement to a PDF at `file_path`.
 
-    for index, time_stamp in enumerate(df["Time Created"]):
-        time_stamp = str(time_stamp)
-        day, time = time_stamp.split(" ")[0], time_stamp.split(" ")[1][:8]
-        df.loc[index, "Time Created"] = f"{day} {time}"
+    `progress`, when given, is called with a percentage as the work advances.
+    """
+    progress = progress or (lambda percent: None)
 
-    # create a pdf statement file
-    table = df.to_html(classes="my-style", index=False)
+    count = (
+        db.query(func.count(Expenditure.id))
+        .filter(Expenditure.user_id == current_user_id)
+        .scalar()
+    )
+
+    if not count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="You have no expenses, create an expenditure to get statement.",
+        )
 
+    user = db.get(User, current_user_id)
     (
         total_credits,
         total_expenses,
         total_transaction,
         money_at_hand,
-    ) = total_transactions(db, current_user_id)
-
-    html_string = f"""
-    <html>
-      <head>
-      
-      <style>
-        .my-style {{
-            font-size: 11px;
-            font-family: Arial;
-            border-collapse: collapse;
-            border: 3px solid silver;
-        
-            }}
-        
-        .my-style td, th {{
-            padding: 10px;
-            text-align: right;
-            margin-right: 3px;
-        }}
-        
-        .my-style tr:nth-child(even) {{
-            background: #E0E0E0;
-        }}
-        
-        .my-style tr:hover {{
-            background: silver;
-            cursor: pointer;
-        }}
-        
-        .heading {{
-            color: green;
-            margin-bottom: 4px;
-            text-align: left;
-        }}
-
-        .table {{
-            margin: auto;
-            text-align: center; 
-        }}
-        
-        .summary {{
-            text-align: left;   
-        }}
-        
-        .credit {{
-            color: #0E8787;
-        }}
-        
-        .expenses {{
-            color: #E42F17;
-        }}
-        
-        .total {{
-            color: #55E329;
-        }}
-
-        .athand {{
-            color: #E419B7;
-        }}
-
-      </style>
-        <title>{user.username} Casher app expenditure statement</title>
-        <link rel="stylesheet" type="text/css" href="style.css"/>
-      </head>
-      <body>
-      <div class="heading">
-        <h3><em>Transaction statement for {user.first_name} {user.last_name}</em></h3>
-      </div>
-      <div class="table">
-        {table}
-      </div>
-      <div class="summary">
-        <h6>Total credit      : <span class="credit">{format(total_credits, '.2f')}</span></h6>
-        <h6>Total Expenses    : <span class="expenses">{format(total_expenses, '.2f')}</span></h6>
-        <h6>Total Transactions: <span class="total">{format(total_transaction, '.2f')}</span></h6>
-        <h6>Money at hand     : <span class="athand">{format(money_at_hand, '.2f')}</span></h6>
-      </div>        
-      </body>
-    </html>
-    """
-    statement_files = os.listdir("statements")
+    ) = balance_totals(db.get(ExpenditureBalance, current_user_id))
 
-    for file in statement_files:
-        if file == f"{user.username}.pdf":
-            os.remove(f"statements/{file}")
+    chunks = statement_chunks(db, current_user_id)
+    chunk_count = -(-count // statement.STATEMENT_CHUNK_ROWS)
 
-    HTML(string=html_string).write_pdf(f"statements/{user.username}.pdf")
+    progress(10)
+
+    statement.render_pdf(
+        user,
+        chunks,
+        (total_credits, total_expenses, total_transaction, money_at_hand),
+        file_path,
+        lambda done: progress(10 + 85 * min(done, chunk_count) // chunk_count),
+    )
+    progress(100)
@@ -1,249 +1,515 @@
 import datetime
+from collections import defaultdict, namedtuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
-from sqlalchemy import text
+from sqlalchemy import Date, func, case, cast, delete, insert, literal_column, select
 
 from fastapi import HTTPException, status
 
-from .models import Sale
-from schema.schemas import SaleBase
-
+from .database import increment
+from .models import Sale, SaleDailyRollup, User
+from .pagination import keyset_select, keyset_page, DEFAULT_PAGE_SIZE
+from .export import export_rows
+from . import data_version
+from schema.schemas import SaleBase, SaleDisplay, UserAuth, validate_each
 
-def correct_sale(request: SaleBase):
-    if request.item == "":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail="Kindly select what you sold."
-        )
 
-    if request.bought_amount < 0 or request.sell_amount < 0 or request.balance < 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Sell and bought amount must be greater than zero.",
-        )
+def build_sale(request: SaleBase, current_user_id: int, next_day: bool = True):
+    """The new, unsaved Sale of a validated `request`."""
+    # dates from the web client are a day behind the sale; imported ledgers
+    # pass next_day=False as they carry the actual day
+    paid_on = request.sold_on
+    if next_day:
+        paid_on += datetime.timedelta(days=1)
 
-    if request.sell_amount == 0 and request.mode_of_payment != "gift":
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"I have noticed you sold this {request.item} at 0 price, if it was a gift select `gift` on mode of payment.",
-        )
-    mode_of_payment = ["cash", "mobile money", "gift"]
-
-    if request.mode_of_payment.lower() not in mode_of_payment:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Mode of payment may either be `cash`, `mobile money`, `gift`.",
-        )
+    entry_amount = request.bought_amount
+    sale_amount = request.sell_amount
+    balance = request.balance
+    profit = sale_amount - (entry_amount + balance)
 
-    if request.sell_amount == 0 and request.mode_of_payment != "gift":
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"I have noticed you sold this {request.item} at 0 price, if it was a gift select `gift` on mode of payment.",
-        )
+    return Sale(
+        item=request.item,
+        bought_amount=request.bought_amount,
+        sell_amount=request.sell_amount,
+        mode_of_payment=request.mode_of_payment.value,
+        transaction_code=request.transaction_code,
+        balance=request.balance,
+        profit=profit,
+        description=request.description,
+        sold_on=paid_on,
+        user_id=current_user_id,
+        created_on=datetime.datetime.now(),
+    )
 
-    paid_on_date = request.sold_on.split("T")
 
-    print("**********************************\n\n")
+async def create_sale(request: SaleBase, db: AsyncSession, current_user_id: int):
+    new_sale = build_sale(request, current_user_id)
 
-    print(paid_on_date)
+    try:
+        db.add(new_sale)
+        await update_daily_rollup(db, current_user_id, new_sale.sold_on, [new_sale])
+        await data_version.bump(db, current_user_id)
+        await db.commit()
+        # SaleDisplay embeds the user, which cannot be lazy loaded later on
+        await db.refresh(new_sale, ["user"])
+        return new_sale
 
-    
-    print("**********************************\n\n")
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error saving your data, try again later.",
+        )
 
-    paid_on = paid_on_date[0].split("-")
 
-    if len(paid_on) != 3:
+MAX_BATCH_SALES = 1000
+
+SALE_COLUMNS = [
+    "item",
+    "bought_amount",
+    "sell_amount",
+    "mode_of_payment",
+    "transaction_code",
+    "balance",
+    "profit",
+    "description",
+    "sold_on",
+    "user_id",
+    "created_on",
+]
+
+
+async def create_sales(items: list, db: AsyncSession, current_user_id: int):
+    """Save a batch of sales, e.g. queued by a shop while it was offline.
+
+    Every item is validated as a SaleBase on its own. The valid ones are
+    inserted together with a single bulk INSERT and one rollup upsert per
+    day, all in one transaction; the invalid ones are reported and skipped.
+    Returns one result per item, in request order.
+    """
+    if len(items) > MAX_BATCH_SALES:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Enter the date as DD-MM-YYYY.",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Send at most {MAX_BATCH_SALES} sales per batch.",
         )
 
-    paid_on_dates = [paid_on[0], paid_on[1], paid_on[2][:2]]
+    results = [None] * len(items)
+    requests, errors = validate_each(SaleBase, items)
+    for index, message in errors.items():
+        results[index] = {
+            "index": index,
+            "id": None,
+            "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY,
+            "detail": message,
+        }
+
+    valid = [(index, build_sale(request, current_user_id)) for index, request in requests]
+
+    if valid:
+        rows = [
+            {column: getattr(sale, column) for column in SALE_COLUMNS}
+            for _, sale in valid
+        ]
+        sales_by_day = defaultdict(list)
+        for _, sale in valid:
+            sales_by_day[sale.sold_on].append(sale)
 
-    for d in paid_on_dates:
         try:
-            int(d)
+            ids = await db.scalars(
+                insert(Sale).returning(Sale.id, sort_by_parameter_order=True), rows
+            )
+            ids = ids.all()
+            for day, sales in sales_by_day.items():
+                await update_daily_rollup(db, current_user_id, day, sales)
+            await data_version.bump(db, current_user_id)
+            await db.commit()
         except Exception as e:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Invalid dates ->  {paid_on_dates}.",
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Error saving your data, try again later.",
             )
 
-    if int(paid_on[0]) > 2023 or int(paid_on[0]) < 2022:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid calendar Month."
-        )
+        for (index, _), sale_id in zip(valid, ids):
+            results[index] = {
+                "index": index,
+                "id": sale_id,
+                "status_code": status.HTTP_201_CREATED,
+                "detail": None,
+            }
 
-    if int(paid_on[1]) < 1 or int(paid_on[1]) > 12:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid calendar Month."
-        )
+    return results
 
-    if int(paid_on[2]) > 31 or int(paid_on[2]) < 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid date of the month."
-        )
 
-    date_string = f"{paid_on[0]}-{paid_on[1]}-{str(int(paid_on[2]) + 1)}"
-    paid_on = datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
+# the listings are read only: they select the columns of SaleDisplay into
+# these tuples instead of hydrating and tracking Sale objects
+SaleRow = namedtuple("SaleRow", SaleDisplay.model_fields)
+UserRow = namedtuple("UserRow", UserAuth.model_fields)
+SALE_ROW_COLUMNS = [getattr(Sale, field) for field in SaleRow._fields if field != "user"]
 
-    return paid_on
 
+def user_sales_select(current_user_id: int):
+    """The SaleDisplay columns of the user's sales, with the user every
+    sale embeds joined in. Read it with sale_rows."""
+    return (
+        select(*SALE_ROW_COLUMNS, *[getattr(User, field) for field in UserRow._fields])
+        .join(Sale.user)
+        .where(Sale.user_id == current_user_id)
+    )
 
-def create_sale(request: SaleBase, db: Session, current_user_id: int):
-    paid_on = correct_sale(request)
 
-    entry_amount = request.bought_amount
-    sale_amount = request.sell_amount
-    balance = request.balance
-    profit = sale_amount - (entry_amount + balance)
+async def sale_rows(db: AsyncSession, statement):
+    """The SaleRow tuples of a user_sales_select statement. Rows of the same
+    user share one UserRow."""
+    split = len(SALE_ROW_COLUMNS)
+    users = {}
+    rows = []
+    for row in await db.execute(statement):
+        user = users.get(row[split])
+        if user is None:
+            user = users[row[split]] = UserRow._make(row[split:])
+        rows.append(SaleRow(*row[:split], user))
 
-    new_sale = Sale(
-        item=request.item,
-        bought_amount=request.bought_amount,
-        sell_amount=request.sell_amount,
-        mode_of_payment=request.mode_of_payment.lower(),
-        transaction_code=request.transaction_code,
-        balance=request.balance,
-        profit=profit,
-        description=request.description,
-        sold_on=paid_on,
-        user_id=current_user_id,
-        created_on=datetime.datetime.now(),
+    return rows
+
+
+async def user_sales(
+    db: AsyncSession, current_user_id: int, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None
+):
+    """One page of the user's sales, most recent first, and the cursor of
+    the next page (None on the last page)."""
+    statement = keyset_select(
+        user_sales_select(current_user_id),
+        Sale.sold_on,
+        Sale.id,
+        limit,
+        cursor,
+        datetime.date.fromisoformat,
     )
+    sales = await sale_rows(db, statement)
+
+    return keyset_page(sales, Sale.sold_on, Sale.id, limit)
+
+
+EXPORT_FIELDS = [
+    "id",
+    "item",
+    "bought_amount",
+    "sell_amount",
+    "mode_of_payment",
+    "transaction_code",
+    "balance",
+    "profit",
+    "description",
+    "sold_on",
+    "created_on",
+]
+
+
+def export_sales(
+    db: AsyncSession,
+    current_user_id: int,
+    export_format: str,
+    start: datetime.date = None,
+    end: datetime.date = None,
+    gzip: bool = False,
+):
+    """Stream the user's sales sold between `start` and `end` (inclusive,
+    either may be omitted) as CSV or NDJSON byte chunks, oldest first."""
+    statement = (
+        select(*[getattr(Sale, field) for field in EXPORT_FIELDS])
+        .where(Sale.user_id == current_user_id)
+        .order_by(Sale.sold_on, Sale.id)
+    )
+    if start:
+        statement = statement.where(Sale.sold_on >= start)
+    if end:
+        statement = statement.where(Sale.sold_on <= end)
 
-    try:
-        db.add(new_sale)
-        db.commit()
-        db.refresh(new_sale)
-        return new_sale
+    return export_rows(db, statement, EXPORT_FIELDS, export_format, gzip)
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error saving your data, try again later.",
+
+async def daily_sales(date: str, db: AsyncSession, current_user_id: int):
+    return await sale_rows(
+        db,
+        user_sales_select(current_user_id)
+        .where(Sale.sold_on == date)
+        .order_by(Sale.sold_on.desc()),
+    )
+
+
+ROLLUP_TOTALS = {
+    "sale_count": lambda sale: 1,
+    "sell_total": lambda sale: sale.sell_amount,
+    "bought_total": lambda sale: sale.bought_amount,
+    "profit_total": lambda sale: sale.profit,
+    "balance_total": lambda sale: sale.balance,
+}
+
+
+async def update_daily_rollup(db: AsyncSession, user_id: int, day, sales, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) `sales`, all sold by `user_id` on
+    `day`, from the sale_daily_rollup row for that day.
+
+    The rollup is committed or rolled back together with the sales, as it is
+    written in the caller's transaction.
+    """
+    deltas = {
+        name: sign * sum(value(sale) for sale in sales)
+        for name, value in ROLLUP_TOTALS.items()
+    }
+    await increment(db, SaleDailyRollup, {"user_id": user_id, "day": day}, deltas)
+
+    if sign < 0:
+        await db.execute(
+            delete(SaleDailyRollup)
+            .where(SaleDailyRollup.user_id == user_id)
+            .where(SaleDailyRollup.day == day)
+            .where(SaleDailyRollup.sale_count <= 0)
         )
 
 
-def user_sales(db: Session, current_user_id: int):
-    sales = (
-        db.query(Sale)
-        .filter(Sale.user_id == current_user_id)
-        .order_by(Sale.sold_on.desc())
-        .all()
-    )
+def raw_daily_totals(db: Session, user_id: int = None):
+    """The sale_daily_rollup rows recomputed from the raw sale table."""
+    query = db.query(
+        Sale.user_id,
+        Sale.sold_on,
+        func.count(Sale.id),
+        func.sum(Sale.sell_amount),
+        func.sum(Sale.bought_amount),
+        func.sum(Sale.profit),
+        func.sum(Sale.balance),
+    ).group_by(Sale.user_id, Sale.sold_on)
+
+    if user_id is not None:
+        query = query.filter(Sale.user_id == user_id)
+
+    return query
 
-    return sales
 
+def rebuild_daily_rollups(db: Session, user_id: int = None):
+    """Recreate sale_daily_rollup from the raw sale rows.
 
-def daily_sales(date: str, db: Session, current_user_id: int):
-    sales = (
-        db.query(Sale)
-        .filter(Sale.user_id == current_user_id)
-        .filter(Sale.sold_on == date)
-        .order_by(Sale.sold_on.desc())
-        .all()
+    Returns the number of rollup rows written.
+    """
+    clear = delete(SaleDailyRollup)
+    if user_id is not None:
+        clear = clear.where(SaleDailyRollup.user_id == user_id)
+    db.execute(clear)
+
+    result = db.execute(
+        insert(SaleDailyRollup).from_select(
+            ["user_id", "day", *ROLLUP_TOTALS], raw_daily_totals(db, user_id)
+        )
     )
-    return sales
+    db.execute(data_version.bump_statement(db.get_bind().dialect.name, user_id))
+    db.commit()
 
+    return result.rowcount
 
-def generic_transaction_func(sales):
-    buy_price = []
-    all_sales = []
-    all_profit = []
-    on_debpt = []
 
-    for sale in sales:
-        buy_price.append(sale.bought_amount)
-        all_sales.append(sale.sell_amount)
-        all_profit.append(sale.profit)
-        on_debpt.append(sale.balance)
+def verify_daily_rollups(db: Session, user_id: int = None):
+    """Compare sale_daily_rollup with the raw sale rows.
 
-    total_buy_price = sum(buy_price)
-    total_daily_sales = sum(all_sales)
-    total_daily_profit = sum(all_profit)
-    total_debpt = sum(on_debpt)
+    Returns a list of (user_id, day, expected, found) tuples, one per drifted
+    day, where expected and found are tuples of the ROLLUP_TOTALS columns
+    (None when the row is missing).
+    """
+    expected = {
+        (row[0], row[1]): tuple(row[2:]) for row in raw_daily_totals(db, user_id)
+    }
 
+    query = db.query(
+        SaleDailyRollup.user_id,
+        SaleDailyRollup.day,
+        *[getattr(SaleDailyRollup, name) for name in ROLLUP_TOTALS],
+    )
+    if user_id is not None:
+        query = query.filter(SaleDailyRollup.user_id == user_id)
+    found = {(row[0], row[1]): tuple(row[2:]) for row in query}
+
+    return [
+        (key[0], key[1], expected.get(key), found.get(key))
+        for key in sorted(expected.keys() | found.keys())
+        if expected.get(key) != found.get(key)
+    ]
+
+
+def rollup_totals(condition=None):
+    """SUM columns for the rollup days matching `condition`, in the order
+    (sell_total, bought_total, profit_total, balance_total).
+
+    Used as select columns so several date windows can be summed in a single
+    pass over the user's days.
+    """
+    columns = (
+        SaleDailyRollup.sell_total,
+        SaleDailyRollup.bought_total,
+        SaleDailyRollup.profit_total,
+        SaleDailyRollup.balance_total,
+    )
+    if condition is not None:
+        columns = [case((condition, column), else_=0) for column in columns]
+
+    return [func.coalesce(func.sum(column), 0) for column in columns]
+
+
+def generic_transaction_func(total_sales, total_buy_price, total_profit, total_debpt):
     try:
-        percentage_profit = (total_daily_profit / total_buy_price) * 100
-        return (total_daily_sales, total_daily_profit, total_debpt, percentage_profit)
-    except Exception as e:
+        percentage_profit = (total_profit / total_buy_price) * 100
+        return (total_sales, total_profit, total_debpt, percentage_profit)
+    except ZeroDivisionError:
         return 0, 0, 0, 0
 
 
-def daily_transaction(date: str, db: Session, current_user_id: int):
-    sales = (
-        db.query(Sale)
-        .filter(Sale.user_id == current_user_id)
-        .filter(Sale.sold_on == date)
-        .all()
+async def daily_transaction(date: str, db: AsyncSession, current_user_id: int):
+    result = await db.execute(
+        select(func.sum(SaleDailyRollup.sale_count), *rollup_totals())
+        .where(SaleDailyRollup.user_id == current_user_id)
+        .where(SaleDailyRollup.day == date)
     )
+    count, *totals = result.one()
 
-    if sales:
-        return generic_transaction_func(sales)
+    if count:
+        return generic_transaction_func(*totals)
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail=f"You have no transactions on date {date}.",
     )
 
 
-def generic_duration_func(
-    db: Session, current_user_id: int, start_date: int, end_date: int
-):
-    text_query = text(
-        "SELECT * FROM sale WHERE user_id = :id AND sold_on >= :start_date AND sold_on <= :end_date"
+async def transaction_history(db: AsyncSession, current_user_id: int):
+    today = datetime.date.today()
+    week_start = today - datetime.timedelta(days=int(today.strftime("%w")))
+    month_start = today.replace(day=1)
+    next_month_start = (month_start + datetime.timedelta(days=32)).replace(day=1)
+
+    day = SaleDailyRollup.day
+    windows = [
+        day == today,
+        (day >= week_start) & (day <= today),
+        (day >= month_start) & (day < next_month_start),
+        None,
+    ]
+
+    # one round trip over the user's rollup days: every window is a set of
+    # SUM(CASE ...) columns
+    result = await db.execute(
+        select(*[total for window in windows for total in rollup_totals(window)])
+        .where(SaleDailyRollup.user_id == current_user_id)
     )
-    sales = db.execute(
-        text_query,
-        {
-            "start_date": f"{start_date}",
-            "end_date": f"{end_date}",
-            "id": f"{current_user_id}",
-        },
-    )
-
-    return sales
+    row = result.one()
 
+    today_sales, week_sales, monthly, all_sale = (
+        generic_transaction_func(*row[i:i + 4]) for i in range(0, len(row), 4)
+    )
 
-def transaction_history(db: Session, current_user_id: int):
-    today = datetime.datetime.today()
+    return today_sales, week_sales, monthly, all_sale
 
-    date = f"{today.year}-{today.month}-{today.day}"
-    today_sale = generic_duration_func(db, current_user_id, date, date)
-    today_sales = generic_transaction_func(today_sale)
 
-    week_day = today.strftime("%w")
-    week_start = f"{today.year}-{today.month}-{today.day - int(week_day)}"
-    week_end = f"{today.year}-{today.month}-{today.day}"
-    weekly_sale = generic_duration_func(db, current_user_id, week_start, week_end)
-    week_sales = generic_transaction_func(weekly_sale)
+SERIES_BUCKETS = ("day", "week", "month")
+# ten years of days
+MAX_SERIES_BUCKETS = 3660
+
+
+def series_bucket(day: datetime.date, bucket: str):
+    """First day of the `bucket` holding `day`; weeks start on Sunday, as in
+    transaction_history."""
+    if bucket == "week":
+        return day - datetime.timedelta(days=(day.weekday() + 1) % 7)
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_series_bucket(start: datetime.date, bucket: str):
+    if bucket == "week":
+        return start + datetime.timedelta(days=7)
+    if bucket == "month":
+        return (start + datetime.timedelta(days=32)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def series_length(start: datetime.date, end: datetime.date, bucket: str):
+    if bucket == "week":
+        return (series_bucket(end, bucket) - series_bucket(start, bucket)).days // 7 + 1
+    if bucket == "month":
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days + 1
+
+
+def series_bucket_column(dialect: str, bucket: str):
+    """SQL counterpart of series_bucket over SaleDailyRollup.day."""
+    day = SaleDailyRollup.day
+    if bucket == "day":
+        return day
+
+    # literal SQL rather than bound parameters, so the GROUP BY repeats the
+    # very same expression as the select
+    if dialect == "sqlite":
+        # 'weekday 0' moves forward to the next Sunday, so step back six
+        # days first to land on the Sunday on or before the day
+        modifiers = ("'-6 days'", "'weekday 0'") if bucket == "week" else ("'start of month'",)
+        return func.date(day, *map(literal_column, modifiers), type_=Date)
+
+    # date_trunc weeks start on Monday: truncate the next day and step back
+    if bucket == "week":
+        shifted = func.date_trunc(literal_column("'week'"), day + literal_column("interval '1 day'"))
+        return cast(shifted - literal_column("interval '1 day'"), Date)
+    return cast(func.date_trunc(literal_column("'month'"), day), Date)
+
+
+async def sales_series(db: AsyncSession, current_user_id: int, start: datetime.date,
+                       end: datetime.date, bucket: str):
+    """Sales, profit, debt and sale count of every `bucket` between `start`
+    and `end`, both included, as (bucket start, count, sales, bought,
+    profit, debt) rows. Buckets without sales are filled with zeros; the
+    first and last bucket only count the days inside the range."""
+    if end < start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The series must end on or after its start.",
+        )
+    if series_length(start, end, bucket) > MAX_SERIES_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A series can have at most {MAX_SERIES_BUCKETS} buckets, "
+                   f"use a larger bucket.",
+        )
 
-    start_date = f"{today.year}-{today.month}-1"
-    end_date = f"{today.year}-{today.month}-31"
-    monthly_sales = generic_duration_func(db, current_user_id, start_date, end_date)
-    monthly = generic_transaction_func(monthly_sales)
+    bucket_start = series_bucket_column(db.bind.dialect.name, bucket).label("bucket")
+    result = await db.execute(
+        select(bucket_start, func.sum(SaleDailyRollup.sale_count), *rollup_totals())
+        .where(SaleDailyRollup.user_id == current_user_id)
+        .where(SaleDailyRollup.day >= start)
+        .where(SaleDailyRollup.day <= end)
+        .group_by(bucket_start)
+    )
+    totals = {row[0]: tuple(row[1:]) for row in result}
 
-    all_sales = db.query(Sale).filter(Sale.user_id == current_user_id).all()
-    all_sale = generic_transaction_func(all_sales)
+    series = []
+    current = series_bucket(start, bucket)
+    while current <= end:
+        series.append((current, *totals.get(current, (0, 0, 0, 0, 0))))
+        current = next_series_bucket(current, bucket)
 
-    return today_sales, week_sales, monthly, all_sale
+    return series
 
 
-def filter_by_balance(db: Session, current_user_id: int):
-    sales = (
-        db.query(Sale)
-        .filter(Sale.user_id == current_user_id)
-        .filter(Sale.balance > 0)
-        .all()
+async def filter_by_balance(db: AsyncSession, current_user_id: int):
+    return await sale_rows(
+        db, user_sales_select(current_user_id).where(Sale.balance > literal_column("0"))
     )
-    return sales
 
 
-def delete_sale(sale_id: int, db: Session, current_user_id: int):
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+async def delete_sale(sale_id: int, db: AsyncSession, current_user_id: int):
+    sale = await db.get(Sale, sale_id)
 
     if sale:
         if sale.user_id == current_user_id:
-            db.delete(sale)
-            db.commit()
+            await db.delete(sale)
+            await update_daily_rollup(db, sale.user_id, sale.sold_on, [sale], sign=-1)
+            await data_version.bump(db, current_user_id)
+            await db.commit()
         else:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,17 +1,20 @@
 import datetime
 import os
 
-from sqlalchemy.orm.session import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from fastapi import HTTPException, status
 
-from .hashing import bcrypt, verify
+from .hashing import bcrypt_async, verify_async
 
-from schema.schemas import UserBase, UserEditUserType, UserEditPassword
+from auth import user_cache
+from schema.schemas import (UserBase, UserEditUserType, UserEditPassword,
+                            UserPrincipal)
 from .models import User
 
 
-def create_user(request: UserBase, db: Session):
+async def create_user(request: UserBase, db: AsyncSession):
     """
 
     :param request: user request with data
@@ -74,15 +77,16 @@ def create_user(request: UserBase, db: Session):
         last_name=request.last_name.capitalize(),
         username=request.username,
         email=request.email.lower(),
-        password=bcrypt(request.password),
+        password=await bcrypt_async(request.password),
         user_image_url='',
+        user_image_small_url='',
+        user_image_medium_url='',
         user_type=user_type,
         created_on=datetime.datetime.now()
     )
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
         return new_user
     except Exception as e:
         raise HTTPException(
@@ -92,25 +96,23 @@ def create_user(request: UserBase, db: Session):
         )
 
 
-def get_all_users(db: Session, current_user_id: int):
-    current_user = db.query(User).filter(User.id == current_user_id).first()
-
+async def get_all_users(db: AsyncSession, current_user: UserPrincipal):
     if current_user.user_type == 'admin':
-        all_users = db.query(User).all()
-        return all_users
+        all_users = await db.scalars(select(User))
+        return all_users.all()
     else:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='You are not authorized for this '
                                    'information, contact Admin.')
 
 
-def delete_user(user_id: int, db: Session, current_user_id: int):
-    current_user = db.query(User).filter(User.id == current_user_id).first()
-    user = db.query(User).filter(User.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession,
+                      current_user: UserPrincipal):
+    user = await db.get(User, user_id)
 
     if current_user.user_type == 'admin':
         if user:
-            if user.id == current_user_id:
+            if user.id == current_user.id:
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                     detail=f"Why the fuck should you delete "
                                            f"yourself. Contact an Admin to "
@@ -120,15 +122,17 @@ def delete_user(user_id: int, db: Session, current_user_id: int):
             if user.user_type == 'admin':
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                     detail=f"You can't delete an Admin.")
-            db.delete(user)
-            db.commit()
+            await db.delete(user)
+            await db.commit()
+            user_cache.invalidate_user(user.id)
         else:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"User with id '{user_id}' not found.")
     else:
         if user.id == current_user.id:
-            db.delete(user)
-            db.commit()
+            await db.delete(user)
+            await db.commit()
+            user_cache.invalidate_user(user.id)
             return
         
         else:
@@ -137,12 +141,12 @@ def delete_user(user_id: int, db: Session, current_user_id: int):
                                    'contact Admin.')
 
 
-def get_user_by_username(username: str, db: Session):
+async def get_user_by_username(username: str, db: AsyncSession):
     """Get a user from the database using the username
     Used for authentication.
     Args:
         username (str): user username
-        db (Session): the database
+        db (AsyncSession): the database
 
     Raises:
         HTTPException: no user found
@@ -152,7 +156,7 @@ def get_user_by_username(username: str, db: Session):
         :param username:
         :param db:
     """
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
@@ -161,24 +165,24 @@ def get_user_by_username(username: str, db: Session):
     return user
 
 
-def retrieve_user_by_username(username: str, db: Session, current_user_id: int):
+async def retrieve_user_by_username(username: str, db: AsyncSession,
+                                   current_user: UserPrincipal):
     """Get a user from the database using the username
     Used for editing user functionalities
     Args:
         username (str): user username
-        db (Session): the database
+        db (AsyncSession): the database
 
     Raises:
         HTTPException: no user found
 
     Returns:
         dict: user details
-        :param current_user_id:
+        :param current_user:
         :param username:
         :param db:
     """
-    user = db.query(User).filter(User.username == username).first()
-    current_user = db.query(User).filter(User.id == current_user_id).first()
+    user = await db.scalar(select(User).where(User.username == username))
 
     if user:
         if current_user.id == user.id or current_user.user_type == 'admin':
@@ -193,17 +197,15 @@ def retrieve_user_by_username(username: str, db: Session, current_user_id: int):
                         detail=f'No user with username: {username}.')
 
 
-def edit_user_type(request: UserEditUserType, username: str, db: Session,
-                   current_user_id: int):
-    current_user = db.query(User).filter(User.id == current_user_id).first()
-
+async def edit_user_type(request: UserEditUserType, username: str,
+                         db: AsyncSession, current_user: UserPrincipal):
     if current_user.user_type != 'admin':
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='You are not authorize to edit other user details.'
         )    
 
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
 
     if user:
         user_types = ['admin', 'user']
@@ -220,8 +222,8 @@ def edit_user_type(request: UserEditUserType, username: str, db: Session,
         user.user_type = user_type
         try:
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            user_cache.invalidate_user(user.id)
             return user
 
         except Exception as e:
@@ -236,25 +238,28 @@ def edit_user_type(request: UserEditUserType, username: str, db: Session,
     )
 
 
-def edit_user_password(request: UserEditPassword, username: str, db: Session,
-                       current_user_id: int):
-    user = retrieve_user_by_username(username, db, current_user_id)
+async def edit_user_password(request: UserEditPassword, username: str,
+                             db: AsyncSession, current_user: UserPrincipal):
+    user = await retrieve_user_by_username(username, db, current_user)
 
     if user:
 
-        if user.id != current_user_id:
+        if user.id != current_user.id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail='You can only modify you own password.'
             )
 
-        if verify(user.password, request.new_password):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail='That is the same password you are using.Kindly change '
-                       'it.'
-            )
-        if verify(user.password, request.old_password):
+        # one bcrypt check is enough: once the old password is verified, the
+        # new one matches the stored hash only if it equals the old one
+        if await verify_async(user.password, request.old_password):
+            if request.new_password == request.old_password:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail='That is the same password you are using.Kindly '
+                           'change it.'
+                )
+
             if len(request.new_password) < 6:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                     detail='Password must have at least 6 '
@@ -267,11 +272,11 @@ def edit_user_password(request: UserEditPassword, username: str, db: Session,
                            f"characters.",
                 )
 
-            new_password = bcrypt(request.new_password)
+            new_password = await bcrypt_async(request.new_password)
             user.password = new_password
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            user_cache.invalidate_user(user.id)
             return user
         
         raise HTTPException(
@@ -285,18 +290,17 @@ def edit_user_password(request: UserEditPassword, username: str, db: Session,
     )
 
 
-def reset_password(username: str, db: Session,
-                   current_user_id: int):
-    user = retrieve_user_by_username(username, db, current_user_id)
-    current_user = db.query(User).filter(User.id == current_user_id).first()
+async def reset_password(username: str, db: AsyncSession,
+                         current_user: UserPrincipal):
+    user = await retrieve_user_by_username(username, db, current_user)
 
     if user:
         if current_user.user_type == 'admin':
-            new_password = bcrypt('casher')
+            new_password = await bcrypt_async('casher')
             user.password = new_password
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            user_cache.invalidate_user(user.id)
 
             #TODO Create functionality to send email to inform the user his/her 
             # password has been reset to default password 'casher'.
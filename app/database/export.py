@@ -0,0 +1,86 @@
+"""Streaming CSV / NDJSON encoders for the ledger export endpoints.
+
+Rows are streamed from the database with `yield_per`, so the driver hands
+them over in batches and every batch is encoded into a single chunk. Memory stays at
+one batch no matter how long the ledger is, and the first chunk goes out
+as soon as the first batch is read.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from fastapi.responses import StreamingResponse
+
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def csv_encoder(fields):
+    """Returns a function encoding a batch of rows to CSV bytes. The header
+    goes out with the first batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    def encode(batch):
+        writer.writerows(batch)
+        chunk = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    return encode
+
+
+def ndjson_encoder(fields):
+    """Returns a function encoding a batch of rows to NDJSON bytes."""
+    def encode(batch):
+        return "".join(
+            json.dumps(dict(zip(fields, map(_json_value, row)))) + "\n"
+            for row in batch
+        ).encode()
+
+    return encode
+
+
+ENCODERS = {"csv": csv_encoder, "ndjson": ndjson_encoder}
+
+
+async def export_rows(db, statement, fields, export_format: str, gzip: bool = False):
+    """Async generator of encoded byte chunks for every row selected by
+    `statement`, whose columns must match `fields`."""
+    encode = ENCODERS[export_format](fields)
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for batch in result.partitions():
+        chunk = encode(batch)
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    # an empty export still carries the CSV header
+    chunk = encode([])
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_response(chunks, name: str, export_format: str, gzip: bool = False):
+    headers = {"Content-Disposition": f"attachment; filename={name}.{export_format}"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[export_format], headers=headers)
@@ -1,7 +1,29 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
+# bcrypt releases the GIL while hashing, so a small thread pool keeps the
+# ~200ms of CPU per hash off the event loop while capping how many hashes
+# run at once; requests beyond that wait in the pool's queue.
+PASSWORD_WORKERS = int(os.environ.get('CASHER_PASSWORD_WORKERS', os.cpu_count() or 2))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS,
+                               thread_name_prefix='password')
+_metrics_lock = threading.Lock()
+_metrics = {
+    'calls': 0,
+    'waiting': 0,
+    'queue_seconds_total': 0.0,
+    'queue_seconds_max': 0.0,
+    'hash_seconds_total': 0.0,
+}
+
 
 def bcrypt(password: str):
     return pwd_context.hash(password)
@@ -9,3 +31,47 @@ def bcrypt(password: str):
 
 def verify(hashed_password, plain_password):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+async def _in_password_pool(function, *args):
+    submitted = time.perf_counter()
+    with _metrics_lock:
+        _metrics['waiting'] += 1
+
+    def run():
+        started = time.perf_counter()
+        queued = started - submitted
+        with _metrics_lock:
+            _metrics['waiting'] -= 1
+            _metrics['calls'] += 1
+            _metrics['queue_seconds_total'] += queued
+            _metrics['queue_seconds_max'] = max(_metrics['queue_seconds_max'], queued)
+        try:
+            return function(*args)
+        finally:
+            with _metrics_lock:
+                _metrics['hash_seconds_total'] += time.perf_counter() - started
+
+    return await asyncio.wrap_future(_executor.submit(run))
+
+
+async def bcrypt_async(password: str):
+    """bcrypt() on the password pool, without blocking the event loop."""
+    return await _in_password_pool(bcrypt, password)
+
+
+async def verify_async(hashed_password, plain_password):
+    """verify() on the password pool, without blocking the event loop."""
+    return await _in_password_pool(verify, hashed_password, plain_password)
+
+
+def password_metrics():
+    with _metrics_lock:
+        metrics = dict(_metrics)
+
+    calls = metrics['calls'] or 1
+    metrics['workers'] = PASSWORD_WORKERS
+    metrics['queue_seconds_avg'] = metrics['queue_seconds_total'] / calls
+    metrics['hash_seconds_avg'] = metrics['hash_seconds_total'] / calls
+
+    return metrics
@@ -0,0 +1,180 @@
+"""Bulk import of historical sales and expenditures from CSV files.
+
+The file is read CHUNK_ROWS rows at a time, so memory stays bounded however
+long it is. Each chunk is validated against the API schemas (SaleBase /
+ExpenditureBase) in one pydantic pass; its valid rows are written with one
+bulk INSERT and committed together with the import's checkpoint row. Running an
+interrupted import again with the same file skips the rows its checkpoint
+already counts, so no row is imported twice.
+
+Rollups and balances are not maintained row by row: they are rebuilt for
+the user once the whole file is in.
+
+Files need a header row with the fields of SaleBase or ExpenditureBase;
+other columns are ignored, so the files of the /export endpoints can be
+imported back. Their created_on / time_stamp columns are kept when present.
+"""
+import csv
+import datetime
+import hashlib
+import itertools
+import os
+
+from sqlalchemy import insert
+from sqlalchemy.orm.session import Session
+
+from . import data_version, db_sales, db_expenditure
+from .models import Sale, Expenditure, ImportCheckpoint, User
+from schema.schemas import SaleBase, ExpenditureBase, validate_each
+
+CHUNK_ROWS = 5000
+
+# bytes of the file hashed into the checkpoint key, with its size
+CHECKPOINT_SAMPLE_BYTES = 1024 * 1024
+
+
+def _timestamp(value: str, default: datetime.datetime):
+    return datetime.datetime.fromisoformat(value) if value else default
+
+
+def sale_values(request: SaleBase, row: dict, user_id: int):
+    sale = db_sales.build_sale(request, user_id, next_day=False)
+    values = {column: getattr(sale, column) for column in db_sales.SALE_COLUMNS}
+    values["created_on"] = _timestamp(row.get("created_on"), values["created_on"])
+    return values
+
+
+def expenditure_values(request: ExpenditureBase, row: dict, user_id: int):
+    paid_on = request.paid_on
+    return {
+        "money_type": request.money_type.value,
+        "amount": request.amount,
+        "paid_on": paid_on.isoformat(),
+        "description": request.description,
+        "user_id": user_id,
+        # statements list expenditures by time_stamp, keep them in the order
+        # they were paid
+        "time_stamp": _timestamp(
+            row.get("time_stamp"), datetime.datetime.combine(paid_on, datetime.time())
+        ),
+    }
+
+
+# kind -> (model, schema, row converter, aggregate rebuild)
+KINDS = {
+    "sales": (Sale, SaleBase, sale_values, db_sales.rebuild_daily_rollups),
+    "expenditures": (Expenditure, ExpenditureBase, expenditure_values,
+                     db_expenditure.rebuild_balances),
+}
+
+
+def checkpoint_key(kind: str, user_id: int, file_path: str):
+    digest = hashlib.sha256(f"{kind}:{user_id}:{os.path.getsize(file_path)}:".encode())
+    with open(file_path, "rb") as file:
+        digest.update(file.read(CHECKPOINT_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def convert_chunk(schema, convert, rows, user_id: int, first_row: int):
+    """Returns the insert values of the valid rows and a (row number, row,
+    error) tuple for each rejected one."""
+    requests, errors = validate_each(schema, rows)
+    rejected = [
+        (first_row + index, rows[index], message) for index, message in errors.items()
+    ]
+
+    values = []
+    for index, request in requests:
+        try:
+            values.append(convert(request, rows[index], user_id))
+        except ValueError as e:
+            # a malformed created_on / time_stamp column
+            rejected.append((first_row + index, rows[index], str(e)))
+
+    return values, sorted(rejected, key=lambda rejection: rejection[0])
+
+
+def import_file(db: Session, kind: str, file_path: str, user_id: int,
+                chunk_rows: int = CHUNK_ROWS, restart: bool = False,
+                rejects_path: str = None, progress=None):
+    """Import `file_path` as `kind` rows of `user_id` and return the
+    checkpoint. `progress` is called after every chunk with the checkpoint
+    and the number of rows read by this run.
+
+    Raises ValueError when the user does not exist or the file was already
+    imported (unless `restart`, which imports it again from the top).
+    """
+    model, schema, convert, rebuild = KINDS[kind]
+    progress = progress or (lambda checkpoint, rows_this_run: None)
+
+    if not db.get(User, user_id):
+        raise ValueError(f"No user with id {user_id}.")
+
+    key = checkpoint_key(kind, user_id, file_path)
+    checkpoint = db.get(ImportCheckpoint, key)
+    if checkpoint and restart:
+        db.delete(checkpoint)
+        db.commit()
+        checkpoint = None
+    if checkpoint and checkpoint.finished_on:
+        raise ValueError(
+            f"{file_path} was already imported on {checkpoint.finished_on:%Y-%m-%d %H:%M}."
+        )
+    if not checkpoint:
+        checkpoint = ImportCheckpoint(
+            key=key, kind=kind, user_id=user_id, file_path=os.path.abspath(file_path),
+            rows_read=0, rows_imported=0, rows_rejected=0,
+            started_on=datetime.datetime.now(),
+        )
+        db.add(checkpoint)
+        db.commit()
+
+    resumed_from = checkpoint.rows_read
+    dialect = db.get_bind().dialect.name
+    rejects_file = rejects = None
+    with open(file_path, newline="") as file:
+        reader = csv.DictReader(file)
+        rows = itertools.islice(reader, checkpoint.rows_read, None)
+
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_rows))
+                if not chunk:
+                    break
+
+                values, rejected = convert_chunk(
+                    schema, convert, chunk, user_id, checkpoint.rows_read + 1
+                )
+                if values:
+                    db.execute(insert(model), values)
+                    db.execute(data_version.bump_statement(dialect, user_id))
+
+                checkpoint.rows_read += len(chunk)
+                checkpoint.rows_imported += len(values)
+                checkpoint.rows_rejected += len(rejected)
+                checkpoint.updated_on = datetime.datetime.now()
+                # the rows and the checkpoint counting them commit together
+                db.commit()
+
+                if rejected and rejects_path:
+                    if rejects is None:
+                        new_file = not os.path.exists(rejects_path)
+                        rejects_file = open(rejects_path, "a", newline="")
+                        rejects = csv.writer(rejects_file)
+                        if new_file:
+                            rejects.writerow(["row", "error", *reader.fieldnames])
+                    rejects.writerows(
+                        [number, error, *row.values()] for number, row, error in rejected
+                    )
+
+                progress(checkpoint, checkpoint.rows_read - resumed_from)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+    rebuild(db, user_id)
+    checkpoint.finished_on = datetime.datetime.now()
+    db.commit()
+    db.refresh(checkpoint)
+
+    return checkpoint
@@ -0,0 +1,117 @@
+"""Versioned schema migrations.
+
+`create_all` only creates missing tables, so anything an existing database
+needs beyond that (new indexes, backfilled ledgers, ...) is a numbered step
+in MIGRATIONS. Applied versions are recorded in the schema_migration table
+and every step runs at most once per database.
+
+Every worker upgrades on startup, so the table creation and each step run
+under a database-wide lock (see lock) and a step is checked again once the
+lock is held. A step that commits on its own, like the ledger backfill,
+releases the lock early; if another process then applies it as well, the
+loser's record of it is a duplicate and is dropped.
+"""
+import datetime
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, db_sales, db_expenditure
+
+# pg_advisory_xact_lock key of the upgrade, "casher" in ASCII
+MIGRATION_LOCK_KEY = 0x636173686572
+
+
+def lock(db: Session):
+    """Hold the upgrade lock until `db`'s transaction ends; other processes
+    upgrading the same database wait for it."""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(MIGRATION_LOCK_KEY)))
+    elif dialect == "sqlite":
+        # take the write lock now rather than at the first write, waiting up
+        # to busy_timeout for another process's upgrade
+        db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def is_applied(db: Session, version: int):
+    return db.scalar(
+        select(models.SchemaMigration.version).where(models.SchemaMigration.version == version)
+    ) is not None
+
+
+def backfill_ledgers(db: Session):
+    db_sales.rebuild_daily_rollups(db)
+    db_expenditure.rebuild_balances(db)
+
+
+def create_hot_filter_indexes(db: Session):
+    for table in (models.Sale.__table__, models.Expenditure.__table__):
+        for index in table.indexes:
+            index.create(bind=db.connection(), checkfirst=True)
+
+
+def add_missing_columns(db: Session, table, columns):
+    existing = {column["name"] for column in inspect(db.connection()).get_columns(table.name)}
+    for column in columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=db.bind.dialect)
+            db.connection().exec_driver_sql(
+                f'ALTER TABLE "{table.name}" ADD COLUMN {column.name} {column_type}'
+            )
+
+
+def add_image_thumbnail_columns(db: Session):
+    table = models.User.__table__
+    add_missing_columns(db, table, (table.c.user_image_small_url, table.c.user_image_medium_url))
+
+
+def add_statement_heartbeat_column(db: Session):
+    table = models.StatementJob.__table__
+    add_missing_columns(db, table, (table.c.heartbeat_on,))
+
+
+MIGRATIONS = [
+    (1, "backfill sale_daily_rollup and expenditure_balance", backfill_ledgers),
+    (2, "composite and partial indexes for the hot filters", create_hot_filter_indexes),
+    (3, "user image thumbnail columns", add_image_thumbnail_columns),
+    (4, "statement job heartbeat column", add_statement_heartbeat_column),
+]
+
+
+def upgrade(engine):
+    """Create missing tables, then apply every migration newer than the
+    database's current version. Returns the list of versions applied."""
+    applied = []
+    with Session(engine) as db:
+        lock(db)
+        models.Base.metadata.create_all(db.connection())
+        done = {version for (version,) in db.query(models.SchemaMigration.version)}
+        db.commit()
+
+        for version, description, migrate in MIGRATIONS:
+            if version in done:
+                continue
+
+            lock(db)
+            if is_applied(db, version):
+                db.rollback()
+                continue
+
+            migrate(db)
+            db.add(
+                models.SchemaMigration(
+                    version=version,
+                    description=description,
+                    applied_on=datetime.datetime.now(),
+                )
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                continue
+            applied.append(version)
+
+    return applied
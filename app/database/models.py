@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, String, DateTime, Float, Date
+from sqlalchemy import Column, Integer, ForeignKey, String, DateTime, Float, Date, Index, text
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -14,10 +14,17 @@ class User(Base):
     email = Column(String, unique=True)
     password = Column(String)
     user_image_url = Column(String)
+    user_image_small_url = Column(String)
+    user_image_medium_url = Column(String)
     user_type = Column(String)
     created_on = Column(DateTime)
     expenditures = relationship('Expenditure', back_populates='user', cascade='all, delete, delete-orphan')
     sales = relationship('Sale', back_populates='user', cascade='all, delete, delete-orphan' )
+    sale_rollups = relationship('SaleDailyRollup', cascade='all, delete, delete-orphan')
+    expenditure_balance = relationship('ExpenditureBalance', uselist=False, cascade='all, delete, delete-orphan')
+    statement_jobs = relationship('StatementJob', cascade='all, delete, delete-orphan')
+    import_checkpoints = relationship('ImportCheckpoint', cascade='all, delete, delete-orphan')
+    data_version = relationship('DataVersion', uselist=False, cascade='all, delete, delete-orphan')
 
 
 class Expenditure(Base):
@@ -32,6 +39,26 @@ class Expenditure(Base):
     user = relationship('User', back_populates='expenditures')
     time_stamp = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_expenditure_user_id_time_stamp', 'user_id', 'time_stamp'),
+    )
+
+
+class ExpenditureBalance(Base):
+    __tablename__ = 'expenditure_balance'
+
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    total_credits = Column(Float, default=0)
+    total_expenses = Column(Float, default=0)
+    money_at_hand = Column(Float, default=0)
+
+
+class DataVersion(Base):
+    __tablename__ = 'data_version'
+
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    version = Column(Integer, default=0)
+
 
 class Sale(Base):
     __tablename__ = 'sale'
@@ -48,4 +75,71 @@ class Sale(Base):
     sold_on = Column(Date)
     created_on = Column(DateTime)
     user_id = Column(Integer, ForeignKey('user.id'))
-    user = relationship('User', back_populates='sales')
\ No newline at end of file
+    user = relationship('User', back_populates='sales')
+
+    __table_args__ = (
+        Index('ix_sale_user_id_sold_on', 'user_id', 'sold_on'),
+        # only sales still owed money; filter_by_balance repeats this exact
+        # predicate so the planner can match the partial index
+        Index('ix_sale_user_id_on_debt', 'user_id',
+              sqlite_where=text('balance > 0'), postgresql_where=text('balance > 0')),
+    )
+
+
+class SaleDailyRollup(Base):
+    __tablename__ = 'sale_daily_rollup'
+
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sale_count = Column(Integer, default=0)
+    sell_total = Column(Integer, default=0)
+    bought_total = Column(Integer, default=0)
+    profit_total = Column(Integer, default=0)
+    balance_total = Column(Integer, default=0)
+
+
+class StatementJob(Base):
+    __tablename__ = 'statement_job'
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
+    status = Column(String)
+    progress = Column(Integer, default=0)
+    file_path = Column(String)
+    error = Column(String)
+    created_on = Column(DateTime)
+    # refreshed by the rendering worker, see jobs.statements
+    heartbeat_on = Column(DateTime)
+    finished_on = Column(DateTime)
+
+
+class StatementCacheEntry(Base):
+    __tablename__ = 'statement_cache'
+
+    key = Column(String, primary_key=True)
+    file_path = Column(String)
+    size = Column(Integer)
+    last_access = Column(DateTime, index=True)
+
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migration'
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String)
+    applied_on = Column(DateTime)
+
+
+class ImportCheckpoint(Base):
+    __tablename__ = 'import_checkpoint'
+
+    key = Column(String, primary_key=True)
+    kind = Column(String)
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
+    file_path = Column(String)
+    rows_read = Column(Integer, default=0)
+    rows_imported = Column(Integer, default=0)
+    rows_rejected = Column(Integer, default=0)
+    started_on = Column(DateTime)
+    updated_on = Column(DateTime)
+    finished_on = Column(DateTime)
@@ -0,0 +1,54 @@
+"""Keyset (cursor) pagination for the listing endpoints.
+
+Pages are ordered by (sort column, id) descending and the cursor carries the
+last row's pair, so every page is a single index seek no matter how deep it
+is, unlike OFFSET which reads and discards all the rows before it.
+"""
+import base64
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(value, row_id: int):
+    payload = json.dumps([value.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, parse):
+    """Returns the (sort value, id) pair stored in `cursor`, with the sort
+    value converted back by `parse` (e.g. datetime.date.fromisoformat)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return parse(value), int(row_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid page cursor.",
+        )
+
+
+def keyset_select(statement, sort_column, id_column, limit: int, cursor: str, parse):
+    """`statement` limited to the page after `cursor`, newest first. One
+    extra row is selected to tell whether another page follows."""
+    if cursor:
+        value, row_id = decode_cursor(cursor, parse)
+        statement = statement.where(tuple_(sort_column, id_column) < tuple_(value, row_id))
+
+    return statement.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def keyset_page(rows, sort_column, id_column, limit: int):
+    """Returns the rows of a keyset_select page and the cursor of the next
+    page (None on the last page)."""
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
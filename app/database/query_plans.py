@@ -0,0 +1,209 @@
+"""EXPLAIN QUERY PLAN regression check for the hot db_* queries.
+
+Seeds a throwaway SQLite file, runs each read path in db_sales and
+db_expenditure against it while recording the SQL they emit, and asks
+SQLite how it would execute every statement. Any plan step that scans a
+whole table instead of searching an index is reported.
+
+The sale listings are also serialised as SaleDisplay, at a small and a
+large page size. Each must take the same SALE_LISTING_STATEMENTS whatever
+its rows, and serialising must not load anything lazily.
+"""
+import asyncio
+import datetime
+import os
+import tempfile
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from . import db_sales, db_expenditure, migrations
+from .database import async_url
+from .models import User, Sale, Expenditure
+from schema.schemas import SaleDisplay
+
+SEED_DAYS = 60
+SEED_SALES_PER_DAY = 5
+
+# the sales are selected with their user joined in
+SALE_LISTING_STATEMENTS = 1
+
+
+def seed(db: Session):
+    today = datetime.date.today()
+
+    users = [
+        User(username=f"user{i}", email=f"user{i}@casher.app", user_type="user")
+        for i in range(2)
+    ]
+    db.add_all(users)
+    db.flush()
+
+    for user in users:
+        for offset in range(SEED_DAYS):
+            day = today - datetime.timedelta(days=offset)
+            for n in range(SEED_SALES_PER_DAY):
+                db.add(
+                    Sale(item="item", bought_amount=100, sell_amount=150,
+                         mode_of_payment="cash", transaction_code="",
+                         balance=n % 2 * 10, profit=50 - n % 2 * 10,
+                         description="", sold_on=day, user_id=user.id,
+                         created_on=datetime.datetime.now())
+                )
+            db.add(
+                Expenditure(money_type="credit" if offset % 2 else "expense",
+                            amount=10.0, paid_on=str(day), description="",
+                            user_id=user.id,
+                            time_stamp=datetime.datetime.now())
+            )
+    db.commit()
+
+    db_sales.rebuild_daily_rollups(db)
+    db_expenditure.rebuild_balances(db)
+    db.execute(text("ANALYZE"))
+
+    return users[0].id, today
+
+
+async def next_page(list_page, db, user_id: int):
+    """The second page of a keyset listing, as a client would request it."""
+    _, cursor = await list_page(db, user_id, 10)
+    return await list_page(db, user_id, 10, cursor)
+
+
+def hot_queries(user_id: int, today: datetime.date):
+    """(name, coroutine function) pairs for every read path that is checked."""
+    day = str(today)
+    return [
+        ("db_sales.user_sales", lambda db: db_sales.user_sales(db, user_id)),
+        ("db_sales.user_sales (next page)",
+         lambda db: next_page(db_sales.user_sales, db, user_id)),
+        ("db_sales.daily_sales", lambda db: db_sales.daily_sales(day, db, user_id)),
+        ("db_sales.daily_transaction",
+         lambda db: db_sales.daily_transaction(day, db, user_id)),
+        ("db_sales.transaction_history",
+         lambda db: db_sales.transaction_history(db, user_id)),
+        ("db_sales.sales_series (week)",
+         lambda db: db_sales.sales_series(
+             db, user_id, today - datetime.timedelta(days=SEED_DAYS), today, "week"
+         )),
+        ("db_sales.filter_by_balance",
+         lambda db: db_sales.filter_by_balance(db, user_id)),
+        ("db_expenditure.user_expenditures",
+         lambda db: db_expenditure.user_expenditures(db, user_id)),
+        ("db_expenditure.user_expenditures (next page)",
+         lambda db: next_page(db_expenditure.user_expenditures, db, user_id)),
+        ("db_expenditure.total_transactions",
+         lambda db: db_expenditure.total_transactions(db, user_id)),
+    ]
+
+
+def sale_listings(user_id: int, today: datetime.date):
+    """(name, coroutine function returning sales) pairs for every listing
+    serialised as SaleDisplay."""
+    async def page(db, limit):
+        sales, _ = await db_sales.user_sales(db, user_id, limit)
+        return sales
+
+    return [
+        ("db_sales.user_sales (1 row)", lambda db: page(db, 1)),
+        ("db_sales.user_sales (100 rows)", lambda db: page(db, 100)),
+        ("db_sales.daily_sales", lambda db: db_sales.daily_sales(str(today), db, user_id)),
+        ("db_sales.filter_by_balance", lambda db: db_sales.filter_by_balance(db, user_id)),
+    ]
+
+
+async def count_listing_statements(engine, user_id: int, today: datetime.date):
+    """Returns a list of (listing name, rows, statements, statements while
+    serialising) for every sale listing. The serialisation runs where lazy
+    loads are allowed, so a missing eager load shows up as statements
+    rather than an error."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    results = []
+    for name, run in sale_listings(user_id, today):
+        # a fresh session per listing, so no user is already in the
+        # identity map
+        async with AsyncSession(engine) as db:
+            statements.clear()
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            try:
+                sales = await run(db)
+                listed = len(statements)
+                await db.run_sync(lambda session: [
+                    SaleDisplay.model_validate(sale, from_attributes=True) for sale in sales
+                ])
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", record)
+            results.append((name, len(sales), listed, len(statements) - listed))
+
+    return results
+
+
+def full_scans(plan):
+    """The plan steps that read a whole table, e.g. 'SCAN sale'."""
+    return [
+        detail for *_, detail in plan
+        if detail.startswith("SCAN") and " USING " not in detail
+    ]
+
+
+async def explain_hot_queries(engine, user_id: int, today: datetime.date):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    results = []
+    async with AsyncSession(engine) as db:
+        for name, run in hot_queries(user_id, today):
+            statements.clear()
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            try:
+                await run(db)
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+            connection = await db.connection()
+            for statement, parameters in list(statements):
+                plan = (
+                    await connection.exec_driver_sql(
+                        f"EXPLAIN QUERY PLAN {statement}", parameters
+                    )
+                ).all()
+                details = [detail for *_, detail in plan]
+                results.append((name, statement, details, full_scans(plan)))
+
+    return results
+
+
+def check_query_plans():
+    """Returns a list of (query name, sql, plan details, full scans) and
+    the results of count_listing_statements."""
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'plans.db')}"
+
+        # seeding and migrations are synchronous, the checked reads run on
+        # the asyncio engine like they do behind the routes
+        engine = create_engine(url)
+        migrations.upgrade(engine)
+        with Session(engine) as db:
+            user_id, today = seed(db)
+        engine.dispose()
+
+        async def explain():
+            async_engine = create_async_engine(async_url(url))
+            try:
+                return (
+                    await explain_hot_queries(async_engine, user_id, today),
+                    await count_listing_statements(async_engine, user_id, today),
+                )
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(explain())
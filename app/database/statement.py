@@ -0,0 +1,173 @@
+"""HTML templates and PDF rendering for expenditure statements.
+
+Rows are formatted straight into precompiled row templates as they are
+read, and the ledger is laid out in chunks of STATEMENT_CHUNK_ROWS rows.
+Each chunk is parsed, laid out and written to a PDF of its own before the
+next is read, and its box tree is dropped with it; pypdf appends the
+chunk's pages to the statement. Memory is bounded by one chunk's box tree
+plus the compressed pages written so far, which is what
+`manage.py statement-benchmark` measures.
+"""
+import io
+from html import escape
+
+STATEMENT_CHUNK_ROWS = 1000
+
+STYLE = """
+        .my-style {
+            font-size: 11px;
+            font-family: Arial;
+            border-collapse: collapse;
+            border: 3px solid silver;
+
+            }
+
+        .my-style td, th {
+            padding: 10px;
+            text-align: right;
+            margin-right: 3px;
+        }
+
+        .my-style tr:nth-child(even) {
+            background: #E0E0E0;
+        }
+
+        .my-style tr:hover {
+            background: silver;
+            cursor: pointer;
+        }
+
+        .heading {
+            color: green;
+            margin-bottom: 4px;
+            text-align: left;
+        }
+
+        .table {
+            margin: auto;
+            text-align: center;
+        }
+
+        .summary {
+            text-align: left;
+        }
+
+        .credit {
+            color: #0E8787;
+        }
+
+        .expenses {
+            color: #E42F17;
+        }
+
+        .total {
+            color: #55E329;
+        }
+
+        .athand {
+            color: #E419B7;
+        }
+
+"""
+
+DOCUMENT_OPEN = """<html>
+  <head>
+  <style>{style}</style>
+    <title>{username} Casher app expenditure statement</title>
+  </head>
+  <body>
+"""
+
+HEADING = """  <div class="heading">
+    <h3><em>Transaction statement for {first_name} {last_name}</em></h3>
+  </div>
+"""
+
+TABLE_OPEN = """  <div class="table">
+    <table border="1" class="my-style">
+      <thead>
+        <tr><th>Money Type</th><th>Amount</th><th>Paid On</th><th>Description</th><th>Time Created</th></tr>
+      </thead>
+      <tbody>
+"""
+
+ROW = "        <tr><td>{}</td><td>{:.2f}</td><td>{}</td><td>{}</td><td>{}</td></tr>\n"
+
+TABLE_CLOSE = """      </tbody>
+    </table>
+  </div>
+"""
+
+SUMMARY = """  <div class="summary">
+    <h6>Total credit      : <span class="credit">{:.2f}</span></h6>
+    <h6>Total Expenses    : <span class="expenses">{:.2f}</span></h6>
+    <h6>Total Transactions: <span class="total">{:.2f}</span></h6>
+    <h6>Money at hand     : <span class="athand">{:.2f}</span></h6>
+  </div>
+"""
+
+DOCUMENT_CLOSE = """  </body>
+</html>
+"""
+
+
+def format_rows(rows):
+    """HTML table rows for (money_type, amount, paid_on, description,
+    time_stamp, ...) tuples."""
+    return "".join(
+        ROW.format(
+            escape(money_type or ""),
+            amount or 0,
+            escape(str(paid_on or "")),
+            escape(description or ""),
+            time_stamp.strftime("%Y-%m-%d %H:%M:%S") if time_stamp else "",
+        )
+        for money_type, amount, paid_on, description, time_stamp, *_ in rows
+    )
+
+
+def chunk_documents(user, chunks, totals):
+    """One HTML document per chunk of rows: the heading goes on the first
+    and the totals summary after the last."""
+    document_open = DOCUMENT_OPEN.format(style=STYLE, username=escape(user.username))
+    heading = HEADING.format(
+        first_name=escape(user.first_name), last_name=escape(user.last_name)
+    )
+
+    chunks = iter(chunks)
+    chunk = next(chunks, [])
+    first = True
+    while True:
+        following = next(chunks, None)
+
+        parts = [document_open]
+        if first:
+            parts.append(heading)
+        parts += [TABLE_OPEN, format_rows(chunk), TABLE_CLOSE]
+        if following is None:
+            parts.append(SUMMARY.format(*totals))
+        parts.append(DOCUMENT_CLOSE)
+
+        yield "".join(parts)
+
+        if following is None:
+            return
+        chunk, first = following, False
+
+
+def render_pdf(user, chunks, totals, file_path: str, progress=None):
+    """Lay out the chunks of rows one at a time and write their pages to
+    `file_path`. `progress` is called with the number of chunks done."""
+    # WeasyPrint and its font stack are slow to import and only needed here
+    from pypdf import PdfWriter
+    from weasyprint import HTML
+
+    writer = PdfWriter()
+    for done, html_string in enumerate(chunk_documents(user, chunks, totals), 1):
+        chunk_pdf = io.BytesIO()
+        HTML(string=html_string).write_pdf(chunk_pdf)
+        writer.append(chunk_pdf)
+        if progress:
+            progress(done)
+
+    writer.write(file_path)
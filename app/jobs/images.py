@@ -0,0 +1,181 @@
+"""Storage of profile images and their thumbnails.
+
+Every image is stored under its owner's directory and named after the hash
+of its content, images/{user_id}/{sha256}.{ext}, so a user's files are
+found from the user record alone and a path never changes content.
+
+Uploads over CASHER_MAX_IMAGE_MB are refused with a 413 before their body
+is read, by middleware.body_limit on UPLOAD_PATH. What gets through is
+streamed to disk in IMAGE_CHUNK_BYTES chunks, hashing as they go, and the
+image itself is checked against the limit again. The WebP
+thumbnails of THUMBNAIL_SIZES are then rendered by a process pool, as
+Pillow decoding and resizing are CPU bound, and stored next to the
+original as {sha256}_{size}.webp. Text formats (svg) are stored
+precompressed as well, as {name}.br and {name}.gz, for routers.static.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import anyio
+from fastapi import HTTPException, UploadFile, status
+
+IMAGE_DIR = "images"
+IMAGE_WORKERS = int(os.environ.get("CASHER_IMAGE_WORKERS", 1))
+MAX_IMAGE_BYTES = int(os.environ.get("CASHER_MAX_IMAGE_MB", 5)) * 1024 * 1024
+# the multipart request around an image adds boundaries and part headers
+MAX_UPLOAD_BYTES = MAX_IMAGE_BYTES + 64 * 1024
+UPLOAD_PATH = "/user/image"
+IMAGE_CHUNK_BYTES = 64 * 1024
+
+# user column -> longest side in pixels
+THUMBNAIL_SIZES = {
+    "user_image_small_url": 64,
+    "user_image_medium_url": 256,
+}
+
+# formats Pillow cannot decode get no thumbnails, the original is used
+PASSTHROUGH_TYPES = {"svg", "webm"}
+
+# formats worth compressing, with the siblings precompress() writes
+PRECOMPRESSED_TYPES = {"svg"}
+PRECOMPRESSED_SUFFIXES = (".br", ".gz")
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def user_dir(user_id: int):
+    return os.path.join(IMAGE_DIR, str(user_id))
+
+
+def thumbnail_path(path: str, size: int):
+    return f"{path.rsplit('.', 1)[0]}_{size}.webp"
+
+
+async def save_upload(image: UploadFile, user_id: int, extension: str):
+    """Write `image` to its content addressed path and return the path."""
+    if image.size is not None and image.size > MAX_IMAGE_BYTES:
+        raise_too_large()
+
+    directory = user_dir(user_id)
+    await anyio.Path(directory).mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    written = 0
+    partial_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+    try:
+        async with await anyio.open_file(partial_path, "wb") as buffer:
+            while chunk := await image.read(IMAGE_CHUNK_BYTES):
+                written += len(chunk)
+                if written > MAX_IMAGE_BYTES:
+                    raise_too_large()
+                digest.update(chunk)
+                await buffer.write(chunk)
+
+        path = os.path.join(directory, f"{digest.hexdigest()}.{extension}")
+        # the same content always lands on the same name, so replacing an
+        # existing copy is harmless
+        await anyio.to_thread.run_sync(os.replace, partial_path, path)
+    finally:
+        await anyio.Path(partial_path).unlink(missing_ok=True)
+
+    return path
+
+
+TOO_LARGE_DETAIL = f"Images can be at most {MAX_IMAGE_BYTES // (1024 * 1024)} MB."
+
+
+def raise_too_large():
+    raise HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=TOO_LARGE_DETAIL,
+    )
+
+
+def make_thumbnails(path: str):
+    """Render the thumbnails of `path` and return {user column: path}.
+    Runs in a worker process; raises OSError when the file is not an image."""
+    # Pillow is only needed by the workers, not by the API processes
+    from PIL import Image, ImageOps
+
+    thumbnails = {}
+    try:
+        with Image.open(path) as original:
+            # phones store the orientation in EXIF instead of rotating the pixels
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+            for column, size in THUMBNAIL_SIZES.items():
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size), Image.LANCZOS)
+                thumbnails[column] = thumbnail_path(path, size)
+                thumbnail.save(thumbnails[column], "WEBP", quality=80, method=4)
+    except Image.DecompressionBombError as e:
+        raise OSError(str(e))
+
+    return thumbnails
+
+
+async def thumbnails(path: str, extension: str):
+    """The thumbnails of `path` by user column. Formats Pillow cannot
+    decode are their own thumbnails."""
+    if extension in PASSTHROUGH_TYPES:
+        return {column: path for column in THUMBNAIL_SIZES}
+
+    try:
+        return await asyncio.wrap_future(get_pool().submit(make_thumbnails, path))
+    except OSError:
+        await anyio.Path(path).unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The file is not a valid image.",
+        )
+
+
+def precompress(path: str, extension: str):
+    """Write the .br and .gz siblings of a text image, keeping only those
+    smaller than the original."""
+    if extension not in PRECOMPRESSED_TYPES:
+        return
+
+    import brotli
+
+    with open(path, "rb") as file:
+        content = file.read()
+
+    compressed = {
+        ".br": brotli.compress(content, quality=11),
+        ".gz": gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    for suffix, body in compressed.items():
+        if len(body) < len(content):
+            with open(path + suffix, "wb") as file:
+                file.write(body)
+
+
+def remove_images(paths):
+    """Delete the files of `paths` and their precompressed siblings;
+    missing files and empty paths are skipped."""
+    for path in set(filter(None, paths)):
+        for file_path in (path, *(path + suffix for suffix in PRECOMPRESSED_SUFFIXES)):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
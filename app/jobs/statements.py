@@ -0,0 +1,264 @@
+"""Background generation of expenditure statement PDFs.
+
+WeasyPrint layout is CPU bound and can take seconds for a long ledger, so
+statements are rendered by a process pool instead of inside the request.
+Every request becomes a row in the statement_job table, which the worker
+process updates with its status and progress. Jobs that were queued when
+the server stopped are submitted again on startup. A running job may still
+be rendering in another server process, so it is only taken back once its
+heartbeat, refreshed with every progress update, is older than
+CASHER_STATEMENT_STALE_SECONDS.
+
+The job table is reached through the synchronous engine; the asyncio routes
+call enqueue() and get_job() with run_in_threadpool, and both open their
+own session.
+
+Rendered PDFs are content addressed: a statement is stored as
+statements/{key}.pdf, where the key hashes everything the statement
+depends on (see db_expenditure.statement_version). A request whose key is
+already cached completes immediately with the existing file. The
+statement_cache table tracks the size and last access of every file, so
+the cache is evicted least recently used first without listing the
+directory.
+"""
+import datetime
+import hashlib
+import os
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, or_
+from sqlalchemy.orm.session import Session
+
+from database import db_expenditure
+from database.database import engine, SessionLocal
+from database.models import StatementJob, StatementCacheEntry
+
+STATEMENT_DIR = "statements"
+STATEMENT_WORKERS = int(os.environ.get("CASHER_STATEMENT_WORKERS", 2))
+STATEMENT_CACHE_BYTES = int(os.environ.get("CASHER_STATEMENT_CACHE_MB", 256)) * 1024 * 1024
+STATEMENT_STALE_SECONDS = int(os.environ.get("CASHER_STATEMENT_STALE_SECONDS", 600))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_pool = None
+
+
+def _init_worker():
+    # connections inherited from the parent process must not be reused
+    engine.dispose(close=False)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=STATEMENT_WORKERS, initializer=_init_worker)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def cache_key(db: Session, current_user_id: int):
+    version = db_expenditure.statement_version(db, current_user_id)
+    return hashlib.sha256(repr(version).encode()).hexdigest()
+
+
+def cache_path(key: str):
+    return os.path.join(STATEMENT_DIR, f"{key}.pdf")
+
+
+def cached_file(db: Session, key: str):
+    """The cached PDF for `key`, marked as just used, or None."""
+    entry = db.get(StatementCacheEntry, key)
+    if not entry or not os.path.exists(entry.file_path):
+        return None
+
+    entry.last_access = datetime.datetime.now()
+    db.commit()
+    return entry.file_path
+
+
+def store_in_cache(db: Session, key: str, file_path: str):
+    """Record a freshly rendered PDF, then evict the least recently used
+    files until the cache fits in STATEMENT_CACHE_BYTES."""
+    db.merge(
+        StatementCacheEntry(
+            key=key,
+            file_path=file_path,
+            size=os.path.getsize(file_path),
+            last_access=datetime.datetime.now(),
+        )
+    )
+    db.commit()
+
+    total = db.query(func.coalesce(func.sum(StatementCacheEntry.size), 0)).scalar()
+    oldest = db.query(StatementCacheEntry).order_by(StatementCacheEntry.last_access)
+
+    for entry in oldest:
+        if total <= STATEMENT_CACHE_BYTES or entry.key == key:
+            break
+        if os.path.exists(entry.file_path):
+            os.remove(entry.file_path)
+        total -= entry.size
+        db.delete(entry)
+    db.commit()
+
+
+def run_job(job_id: str):
+    """Render the statement of job `job_id`. Runs in a worker process."""
+    db = SessionLocal()
+    try:
+        # claim the job, so a job submitted twice is only rendered once
+        claimed = (
+            db.query(StatementJob)
+            .filter(StatementJob.id == job_id, StatementJob.status == QUEUED)
+            .update({"status": RUNNING, "progress": 0,
+                     "heartbeat_on": datetime.datetime.now()})
+        )
+        db.commit()
+        if not claimed:
+            return
+
+        job = db.get(StatementJob, job_id)
+
+        def progress(percent):
+            job.progress = percent
+            job.heartbeat_on = datetime.datetime.now()
+            db.commit()
+
+        try:
+            key = cache_key(db, job.user_id)
+            file_path = cached_file(db, key)
+
+            if not file_path:
+                file_path = cache_path(key)
+                # render next to the final name and move it in place, so
+                # concurrent jobs never serve a half-written file
+                partial_path = f"{file_path}.{job.id}.part"
+                db_expenditure.expenditures_to_pdf(db, job.user_id, partial_path, progress)
+                os.replace(partial_path, file_path)
+                store_in_cache(db, key, file_path)
+
+            job.status = DONE
+            job.progress = 100
+            job.file_path = file_path
+        except HTTPException as e:
+            job.status = FAILED
+            job.error = e.detail
+        except Exception:
+            job.status = FAILED
+            job.error = "Error generating your statement, try again later."
+
+        job.finished_on = datetime.datetime.now()
+        db.commit()
+    finally:
+        db.close()
+
+
+def submit(job_id: str):
+    return get_pool().submit(run_job, job_id)
+
+
+def enqueue(current_user_id: int):
+    """Create a statement job and return it with a future that resolves
+    when it is finished. Statements already in the cache finish at once."""
+    with SessionLocal() as db:
+        job = _create_job(db, current_user_id)
+
+    if job.status == DONE:
+        future = Future()
+        future.set_result(None)
+        return job, future
+
+    return job, submit(job.id)
+
+
+def _create_job(db: Session, current_user_id: int):
+    now = datetime.datetime.now()
+    job = StatementJob(
+        id=uuid.uuid4().hex,
+        user_id=current_user_id,
+        status=QUEUED,
+        progress=0,
+        created_on=now,
+    )
+
+    file_path = cached_file(db, cache_key(db, current_user_id))
+    if file_path:
+        job.status = DONE
+        job.progress = 100
+        job.file_path = file_path
+        job.finished_on = now
+
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    return job
+
+
+def resume_pending_jobs():
+    """Submit again the jobs no server process is working on: the queued
+    ones and the running ones whose worker stopped sending heartbeats."""
+    db = SessionLocal()
+    try:
+        stale = datetime.datetime.now() - datetime.timedelta(seconds=STATEMENT_STALE_SECONDS)
+        # one UPDATE, so processes starting together do not both take a job
+        db.query(StatementJob).filter(
+            StatementJob.status == RUNNING,
+            or_(StatementJob.heartbeat_on.is_(None), StatementJob.heartbeat_on < stale),
+        ).update({"status": QUEUED}, synchronize_session=False)
+        db.commit()
+
+        job_ids = [
+            job_id
+            for (job_id,) in db.query(StatementJob.id).filter(StatementJob.status == QUEUED)
+        ]
+    finally:
+        db.close()
+
+    # run_job claims every job, so one submitted by two processes runs once
+    for job_id in job_ids:
+        submit(job_id)
+
+
+def get_job(job_id: str, current_user_id: int):
+    with SessionLocal() as db:
+        job = db.get(StatementJob, job_id)
+
+    if not job or job.user_id != current_user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No statement job with id {job_id}.",
+        )
+
+    return job
+
+
+def finished_file(job: StatementJob):
+    """The PDF of a finished job and its ETag, or the HTTP error explaining
+    why there is none."""
+    if job.status == FAILED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=job.error)
+
+    if job.status != DONE:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Statement is still {job.status} ({job.progress}%).",
+        )
+
+    if not os.path.exists(job.file_path):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="This statement has expired, request a new one.",
+        )
+
+    # the file name is the content key, so it is a strong validator
+    key = os.path.basename(job.file_path).rsplit(".", 1)[0]
+    return job.file_path, f'"{key}"'
@@ -1,18 +1,26 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 
-from database import models
-from database.database import engine
-from routers import user_route, expenditure, sales
+from database import migrations
+from database.database import engine, async_engine
+from routers import user_route, expenditure, sales, metrics
+from routers.static import ImageFiles
+from middleware.body_limit import BodyLimitMiddleware
+from middleware.compression import CompressionMiddleware
 from auth import authentication
+from jobs import statements, images
 
 
 app = FastAPI()
 
 origins = ["http://localhost:3000"]
 
+# each middleware added wraps those added before it: CORS has to wrap the
+# body limit, or browsers cannot read its 413s
+app.add_middleware(
+    BodyLimitMiddleware,
+    limits={images.UPLOAD_PATH: (images.MAX_UPLOAD_BYTES, images.TOO_LARGE_DETAIL)},
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,17 +28,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-models.Base.metadata.create_all(engine)
+app.add_middleware(CompressionMiddleware)
+
+
+
+@app.on_event("startup")
+def upgrade_database():
+    migrations.upgrade(engine)
+
+
+@app.on_event("startup")
+def resume_statement_jobs():
+    statements.resume_pending_jobs()
+
+
+@app.on_event("shutdown")
+def stop_statement_workers():
+    statements.shutdown_pool()
+
+
+@app.on_event("shutdown")
+def stop_image_workers():
+    images.shutdown_pool()
+
+
+@app.on_event("shutdown")
+async def close_database_connections():
+    await async_engine.dispose()
+
 
 app.include_router(authentication.router)
 app.include_router(user_route.router)
 app.include_router(expenditure.router)
 app.include_router(sales.router)
+app.include_router(metrics.router)
 
-app.mount("/images", StaticFiles(directory="images"), name="images")
+app.mount("/images", ImageFiles(directory="images"), name="images")
 
 
 # if __name__ == "main":
+#     import uvicorn
 #     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,465 @@
+"""Maintenance commands for the casher database.
+
+Run from the app directory, e.g.:
+
+    python manage.py rollup verify
+    python manage.py rollup rebuild --user 3
+    python manage.py balance verify
+    python manage.py migrate
+    python manage.py query-plans
+    python manage.py import-time --budget 2
+    python manage.py stress --writers 8
+    python manage.py batch-benchmark
+    python manage.py image-benchmark
+    python manage.py read-benchmark
+    python manage.py async-benchmark --concurrency 50
+    python manage.py response-benchmark
+    python manage.py validation-benchmark
+    python manage.py compression-benchmark
+    python manage.py statement-benchmark --budget-mb 400
+    python manage.py import sales ledger.csv --user 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from database import db_sales, db_expenditure, migrations, query_plans, importer
+from database.database import engine, SessionLocal
+
+
+def rollup(args):
+    db = SessionLocal()
+    try:
+        if args.action == "rebuild":
+            rows = db_sales.rebuild_daily_rollups(db, args.user)
+            print(f"Rebuilt {rows} sale_daily_rollup rows.")
+            return 0
+
+        drift = db_sales.verify_daily_rollups(db, args.user)
+        for user_id, day, expected, found in drift:
+            print(f"user {user_id} on {day}: expected {expected}, found {found}")
+        print(f"{len(drift)} drifted sale_daily_rollup rows.")
+        return 1 if drift else 0
+    finally:
+        db.close()
+
+
+def balance(args):
+    db = SessionLocal()
+    try:
+        if args.action == "rebuild":
+            rows = db_expenditure.rebuild_balances(db, args.user)
+            print(f"Rebuilt {rows} expenditure_balance rows.")
+            return 0
+
+        drift = db_expenditure.verify_balances(db, args.user)
+        for user_id, expected, found in drift:
+            print(f"user {user_id}: expected {expected}, found {found}")
+        print(f"{len(drift)} drifted expenditure_balance rows.")
+        return 1 if drift else 0
+    finally:
+        db.close()
+
+
+def migrate(args):
+    # main() has already upgraded the database, report what it did
+    if args.applied:
+        print(f"Applied migrations {', '.join(map(str, args.applied))}.")
+    else:
+        print("Database is up to date.")
+    return 0
+
+
+def check_plans(args):
+    plans, listings = query_plans.check_query_plans()
+
+    failures = 0
+    for name, statement, details, scans in plans:
+        print(f"{'FULL SCAN' if scans else 'ok':9}  {name}: {'; '.join(details)}")
+        if scans and args.verbose:
+            print(f"           {' '.join(statement.split())}")
+        failures += bool(scans)
+    print(f"{failures} queries fall back to a full table scan.")
+
+    too_many = 0
+    for name, rows, statements, lazy in listings:
+        over = lazy or statements > query_plans.SALE_LISTING_STATEMENTS
+        print(f"{'TOO MANY' if over else 'ok':9}  {name}: {rows} sales in {statements} "
+              f"statements, {lazy} more while serialising")
+        too_many += bool(over)
+    print(f"{too_many} sale listings issue more than "
+          f"{query_plans.SALE_LISTING_STATEMENTS} statements or load lazily.")
+
+    return 1 if failures or too_many else 0
+
+
+IMPORT_TIME_BUDGET = 2.0
+
+# heavy dependencies that must only be imported on first use
+LAZY_MODULES = ("weasyprint", "pandas", "PIL")
+
+
+def import_time(args):
+    """Import the API module in a fresh interpreter with -X importtime and
+    report the slowest imports."""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [app_dir, env.get("PYTHONPATH")]))
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        errors = [line for line in result.stderr.splitlines()
+                  if not line.startswith("import time:")]
+        print("\n".join(errors))
+        return result.returncode
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative) / 1e6, name.strip()))
+
+    # the module's own line is last and its cumulative time covers the rest
+    total = next(seconds for seconds, name in reversed(imports) if name == args.module)
+    top = sorted(imports, reverse=True)[:args.top]
+
+    for seconds, name in top:
+        print(f"{seconds:8.3f}s  {name}")
+
+    failures = 0
+    eager = sorted({name.split(".")[0] for _, name in imports} & set(LAZY_MODULES))
+    if eager:
+        print(f"Imported eagerly: {', '.join(eager)}.")
+        failures += 1
+
+    print(f"Importing {args.module} took {total:.3f}s (budget {args.budget:.3f}s).")
+    if total > args.budget:
+        failures += 1
+
+    return 1 if failures else 0
+
+
+# the benchmarks and the stress test are imported by their own command
+# only, so maintenance commands do not load their dependencies
+
+
+def stress_test(args):
+    from benchmarks import stress
+
+    profiles = [args.profile] if args.profile else list(stress.PROFILES)
+    results = stress.stress(args.url, profiles, args.writers, args.writes, args.readers)
+
+    print(f"{'profile':8} {'writes/s':>9} {'reads/s':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'wait ms':>8} {'wait s':>7} {'errors':>6}")
+    for name, result in results.items():
+        print(f"{name:8} {result['writes_per_second']:9.1f} "
+              f"{result['reads_per_second']:8.1f} {result['p50_ms']:8.2f} "
+              f"{result['p99_ms']:8.2f} {result['lock_wait_ms_avg']:8.2f} "
+              f"{result['lock_wait_s_total']:7.2f} {result['errors']:6}")
+
+    return 1 if any(result["errors"] for result in results.values()) else 0
+
+
+def benchmark_batch(args):
+    from benchmarks import batch as batch_benchmark
+
+    print(f"{'items':>6} {'single/s':>9} {'batch/s':>9} {'speedup':>8}")
+    sizes = args.sizes or batch_benchmark.BATCH_SIZES
+    for size, single, batch in batch_benchmark.benchmark(sizes):
+        print(f"{size:6} {size / single:9.1f} {size / batch:9.1f} {single / batch:7.1f}x")
+    return 0
+
+
+def benchmark_reads(args):
+    from benchmarks import reads
+
+    print(f"{'rows':>7} {'path':10} {'fetch us/row':>12} {'+validate':>10} {'peak B/row':>10}")
+    for rows, name, fetch, total, peak in reads.benchmark(args.rows or reads.ROW_COUNTS):
+        print(f"{rows:7} {name:10} {fetch:12.2f} {total:10.2f} {peak:10.0f}")
+    return 0
+
+
+def benchmark_async_reads(args):
+    from benchmarks import async_reads
+
+    print(f"{'latency':>7} {'session':8} {'requests/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for latency, results in async_reads.benchmark(
+        args.url,
+        args.rows or async_reads.ROWS,
+        args.requests or async_reads.REQUESTS,
+        args.concurrency or async_reads.CONCURRENCY,
+        args.latency_ms or async_reads.LATENCIES_MS,
+    ):
+        for name, result in results.items():
+            print(f"{latency:5g}ms {name:8} {result['requests_per_second']:10.1f} "
+                  f"{result['p50_ms']:8.2f} {result['p99_ms']:8.2f}")
+    return 0
+
+
+def benchmark_images(args):
+    from benchmarks import images
+
+    views = args.views or images.SCREEN_VIEWS
+    results = images.benchmark(views, args.requests or images.REQUESTS)
+    print(f"{'mount':7} {'avatar/s':>9} {'logo/s':>9}  "
+          f"client: requests and bytes for {views} screens")
+    for name, result in results.items():
+        clients = ", ".join(
+            f"{client} {requests} req {transferred} B"
+            for client, (requests, transferred) in result["screens"].items()
+        )
+        print(f"{name:7} {result['avatar_rps']:9.0f} {result['logo_rps']:9.0f}  {clients}")
+    print(f"304 revalidations/s: {results['after']['revalidate_rps']:.0f}")
+    return 0
+
+
+def benchmark_responses(args):
+    from benchmarks import responses
+
+    results = responses.benchmark(args.rows or responses.ROWS, args.runs or responses.RUNS)
+    print(f"{'encoder':10} {'ms':>8} {'peak MB':>8} {'body MB':>8}")
+    for name, result in results.items():
+        print(f"{name:10} {result['seconds'] * 1000:8.1f} {result['peak_bytes'] / 1e6:8.1f} "
+              f"{result['bytes'] / 1e6:8.2f}")
+    return 0
+
+
+def benchmark_validation(args):
+    from benchmarks import validation
+
+    print(f"{'schema':12} {'before us':>10} {'after us':>9} {'speedup':>8}")
+    for name, before, after in validation.benchmark(
+        args.requests or validation.REQUESTS, args.runs or validation.RUNS
+    ):
+        print(f"{name:12} {before:10.2f} {after:9.2f} {before / after:7.1f}x")
+    return 0
+
+
+def benchmark_compression(args):
+    from benchmarks import compression
+
+    mbps = args.mbps or compression.MBPS
+    print(f"{'payload':16} {'encoding':8} {'bytes':>9} {'saved':>6} {'added ms':>8} "
+          f"{f'at {mbps:g} Mbit/s':>14}")
+    for name, encoding, sent, saved, added, transfer in compression.benchmark(
+        args.rows or compression.ROWS, args.runs or compression.RUNS, mbps
+    ):
+        print(f"{name:16} {encoding:8} {sent:9} {saved:6.0%} {added * 1000:8.2f} "
+              f"{transfer * 1000:11.0f} ms")
+    return 0
+
+
+def benchmark_statements(args):
+    from benchmarks import statements
+
+    budget = args.budget_mb or statements.BUDGET_MB
+    print(f"{'rows':>7} {'pages':>6} {'seconds':>8} {'base MB':>8} {'peak MB':>8} {'PDF MB':>7}")
+    over = 0
+    for rows, pages, seconds, baseline, peak, size in statements.benchmark(
+        args.rows or statements.ROW_COUNTS
+    ):
+        print(f"{rows:7} {pages:6} {seconds:8.1f} {baseline:8.0f} {peak:8.0f} {size / 1e6:7.1f}")
+        over += peak > budget
+    print(f"{over} statements peak over the {budget:g} MB budget.")
+    return 1 if over else 0
+
+
+def import_ledger(args):
+    started = time.perf_counter()
+    read = 0
+
+    def report(checkpoint, rows_this_run):
+        nonlocal read
+        read = rows_this_run
+        rate = read / (time.perf_counter() - started)
+        print(f"{checkpoint.rows_read} rows read, {checkpoint.rows_imported} imported, "
+              f"{checkpoint.rows_rejected} rejected ({rate:.0f} rows/s)")
+
+    db = SessionLocal()
+    try:
+        checkpoint = importer.import_file(
+            db, args.kind, args.file, args.user, args.chunk_rows, args.restart,
+            args.rejects, report,
+        )
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {checkpoint.rows_imported} of {checkpoint.rows_read} rows, "
+          f"{checkpoint.rows_rejected} rejected. Read {read} rows in {elapsed:.1f}s "
+          f"({read / elapsed:.0f} rows/s, including the aggregate rebuild).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rollup_parser = commands.add_parser(
+        "rollup", help="rebuild or verify the per-user daily sales rollup"
+    )
+    rollup_parser.add_argument("action", choices=["rebuild", "verify"])
+    rollup_parser.add_argument("--user", type=int, help="only this user id")
+    rollup_parser.set_defaults(handler=rollup)
+
+    balance_parser = commands.add_parser(
+        "balance", help="rebuild or verify the per-user expenditure balance"
+    )
+    balance_parser.add_argument("action", choices=["rebuild", "verify"])
+    balance_parser.add_argument("--user", type=int, help="only this user id")
+    balance_parser.set_defaults(handler=balance)
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="create missing tables and apply pending migrations"
+    )
+    migrate_parser.set_defaults(handler=migrate)
+
+    plans_parser = commands.add_parser(
+        "query-plans",
+        help="fail when a hot query falls back to a full table scan or a sale "
+             "listing loads its user per row",
+    )
+    plans_parser.add_argument("-v", "--verbose", action="store_true",
+                              help="print the SQL of failing queries")
+    plans_parser.set_defaults(handler=check_plans)
+
+    import_parser = commands.add_parser(
+        "import-time",
+        help="report import time of the API and fail over the budget",
+    )
+    import_parser.add_argument("--module", default="main")
+    import_parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET,
+                               help="seconds")
+    import_parser.add_argument("--top", type=int, default=15,
+                               help="number of slowest imports to list")
+    import_parser.set_defaults(handler=import_time, database=False)
+
+    stress_parser = commands.add_parser(
+        "stress",
+        help="compare write throughput and lock waits of the engine profiles",
+    )
+    stress_parser.add_argument("--url", help="scratch database to write to "
+                               "(default: a temporary SQLite file per profile)")
+    stress_parser.add_argument("--profile", choices=["default", "tuned"],
+                               help="only this profile")
+    stress_parser.add_argument("--writers", type=int, default=8)
+    stress_parser.add_argument("--writes", type=int, default=100,
+                               help="writes per writer")
+    stress_parser.add_argument("--readers", type=int, default=2)
+    stress_parser.set_defaults(handler=stress_test, database=False)
+
+    batch_parser = commands.add_parser(
+        "batch-benchmark",
+        help="compare POST /sales/batch with one POST /sales per item",
+    )
+    batch_parser.add_argument("--sizes", type=int, nargs="+",
+                              help="items per batch (default: 10 100 1000)")
+    batch_parser.set_defaults(handler=benchmark_batch, database=False)
+
+    reads_parser = commands.add_parser(
+        "read-benchmark",
+        help="compare CPU and memory of the ORM and projected sale listings",
+    )
+    reads_parser.add_argument("--rows", type=int, nargs="+",
+                              help="sales seeded per run (default: 10000 100000)")
+    reads_parser.set_defaults(handler=benchmark_reads, database=False)
+
+    async_parser = commands.add_parser(
+        "async-benchmark",
+        help="compare concurrent sale reads through Session and AsyncSession",
+    )
+    async_parser.add_argument("--url", help="database to seed and read "
+                              "(default: a temporary SQLite file)")
+    async_parser.add_argument("--rows", type=int, help="sales seeded (default: 10000)")
+    async_parser.add_argument("--requests", type=int,
+                              help="list and totals requests per session type (default: 2000)")
+    async_parser.add_argument("--concurrency", type=int,
+                              help="clients issuing requests at once (default: 50)")
+    async_parser.add_argument("--latency-ms", type=float, nargs="+",
+                              help="round trip modelled per statement on SQLite "
+                                   "(default: 0 2)")
+    async_parser.set_defaults(handler=benchmark_async_reads, database=False)
+
+    images_parser = commands.add_parser(
+        "image-benchmark",
+        help="compare avatar requests and bytes before and after ImageFiles",
+    )
+    images_parser.add_argument("--views", type=int,
+                               help="screens showing the avatar and logo (default: 50)")
+    images_parser.add_argument("--requests", type=int,
+                               help="requests per throughput measurement (default: 2000)")
+    images_parser.set_defaults(handler=benchmark_images, database=False)
+
+    responses_parser = commands.add_parser(
+        "response-benchmark",
+        help="compare FastAPI's response encoding with model_list_response",
+    )
+    responses_parser.add_argument("--rows", type=int, help="default: 10000")
+    responses_parser.add_argument("--runs", type=int, help="default: 5")
+    responses_parser.set_defaults(handler=benchmark_responses, database=False)
+
+    validation_parser = commands.add_parser(
+        "validation-benchmark",
+        help="compare per-request validation before and after the typed schemas",
+    )
+    validation_parser.add_argument("--requests", type=int, help="default: 10000")
+    validation_parser.add_argument("--runs", type=int, help="default: 5")
+    validation_parser.set_defaults(handler=benchmark_validation, database=False)
+
+    compression_parser = commands.add_parser(
+        "compression-benchmark",
+        help="compare bytes saved and latency added by response compression",
+    )
+    compression_parser.add_argument("--rows", type=int, help="default: 10000")
+    compression_parser.add_argument("--runs", type=int, help="default: 5")
+    compression_parser.add_argument("--mbps", type=float,
+                                    help="link speed the transfer times are computed for "
+                                         "(default: 2)")
+    compression_parser.set_defaults(handler=benchmark_compression, database=False)
+
+    statements_parser = commands.add_parser(
+        "statement-benchmark",
+        help="report the peak memory of statement PDFs and fail over the budget",
+    )
+    statements_parser.add_argument("--rows", type=int, nargs="+",
+                                   help="expenditures per ledger (default: 1000 50000)")
+    statements_parser.add_argument("--budget-mb", type=float,
+                                   help="peak resident set per render (default: 400)")
+    statements_parser.set_defaults(handler=benchmark_statements, database=False)
+
+    ledger_parser = commands.add_parser(
+        "import", help="bulk import a CSV ledger of sales or expenditures"
+    )
+    ledger_parser.add_argument("kind", choices=list(importer.KINDS))
+    ledger_parser.add_argument("file")
+    ledger_parser.add_argument("--user", type=int, required=True,
+                               help="user id the rows belong to")
+    ledger_parser.add_argument("--chunk-rows", type=int, default=importer.CHUNK_ROWS,
+                               help="rows per insert and commit")
+    ledger_parser.add_argument("--rejects", help="append rejected rows to this CSV")
+    ledger_parser.add_argument("--restart", action="store_true",
+                               help="import a file again from its first row")
+    ledger_parser.set_defaults(handler=import_ledger)
+
+    parser.set_defaults(database=True)
+    args = parser.parse_args(argv)
+
+    if args.database:
+        args.applied = migrations.upgrade(engine)
+
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
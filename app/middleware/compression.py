@@ -0,0 +1,181 @@
+"""Negotiated Brotli / gzip compression of responses.
+
+Text responses (the JSON listings, the CSV / NDJSON exports, svg images) are
+compressed with Brotli when the client accepts it, gzip otherwise. Bodies
+below CASHER_COMPRESSION_MIN_BYTES, types that are compressed already
+(images, PDFs) and responses that carry a Content-Encoding of their own
+(the gzip exports, the precompressed svg of routers.static) go out as they
+are.
+
+Streamed responses are compressed chunk by chunk, each chunk flushed as it
+is sent, so an export still reaches the client as soon as its first batch
+is read. Chunks of CASHER_COMPRESSION_THREAD_KB and more are compressed in
+a worker thread, so one large listing does not hold up the event loop.
+"""
+import os
+import zlib
+
+import anyio
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("CASHER_COMPRESSION_MIN_BYTES", 1024))
+# 0-11, the higher levels are meant for static files compressed once
+BROTLI_QUALITY = int(os.environ.get("CASHER_BROTLI_QUALITY", 4))
+# 1-9
+GZIP_LEVEL = int(os.environ.get("CASHER_GZIP_LEVEL", 6))
+COMPRESSION_THREAD_BYTES = int(os.environ.get("CASHER_COMPRESSION_THREAD_KB", 64)) * 1024
+
+# text/* and these; everything else is left alone
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+# preferred first
+ENCODINGS = ("br", "gzip")
+
+
+def accepted_encodings(request_headers: Headers):
+    """The content codings of Accept-Encoding with a non-zero quality."""
+    accepted = set()
+    for coding in request_headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def compressible(headers: Headers):
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return (
+        "content-encoding" not in headers
+        and "no-transform" not in headers.get("cache-control", "")
+        and (media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES)
+    )
+
+
+class BrotliStream:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk: bytes, final: bool):
+        body = self.compressor.process(chunk)
+        return body + (self.compressor.finish() if final else self.compressor.flush())
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes, final: bool):
+        body = self.compressor.compress(chunk)
+        return body + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES,
+                 brotli_quality: int = BROTLI_QUALITY, gzip_level: int = GZIP_LEVEL,
+                 thread_bytes: int = COMPRESSION_THREAD_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_bytes = thread_bytes
+        self.streams = {
+            "br": lambda: BrotliStream(brotli_quality),
+            "gzip": lambda: GzipStream(gzip_level),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            accepted = accepted_encodings(Headers(scope=scope))
+            encoding = next((name for name in ENCODINGS if name in accepted), None)
+            if encoding is not None:
+                responder = CompressionResponder(self, encoding, send)
+                await self.app(scope, receive, responder.send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    """Compresses one response, once its first body message shows whether
+    it is worth it."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.next_send = send
+        self.start_message = None
+        self.stream = None
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # held back until the headers are known
+            self.start_message = message
+            return
+
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            await self.start(start_message, message)
+            return
+
+        if self.stream is not None and message["type"] == "http.response.body":
+            message = await self.compress(message)
+        await self.next_send(message)
+
+    async def start(self, start_message, message):
+        """Send the response start and the first body `message`,
+        compressing both when the response qualifies."""
+        headers = MutableHeaders(raw=start_message["headers"])
+        # pathsend and the like hand the body to the server, untouched
+        if message["type"] != "http.response.body" or not compressible(headers):
+            await self.next_send(start_message)
+            await self.next_send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if more_body:
+            # streamed: only a Content-Length, when there is one, tells the size
+            length = int(headers.get("content-length", self.middleware.minimum_size))
+        else:
+            length = len(body)
+        if length < self.middleware.minimum_size:
+            await self.next_send(start_message)
+            await self.next_send(message)
+            return
+
+        self.stream = self.middleware.streams[self.encoding]()
+        message = await self.compress(message)
+
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(message["body"]))
+        # the compressed bytes are another representation
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+        await self.next_send(start_message)
+        await self.next_send(message)
+
+    async def compress(self, message):
+        body = message.get("body", b"")
+        final = not message.get("more_body", False)
+        if len(body) >= self.middleware.thread_bytes:
+            body = await anyio.to_thread.run_sync(self.stream.compress, body, final)
+        else:
+            body = self.stream.compress(body, final)
+        return {**message, "body": body}
@@ -0,0 +1,99 @@
+"""Conditional GETs of a user's sales and expenditures.
+
+Clients poll the listings and totals on every screen change, and most polls
+find nothing new. The read routes depend on conditional_get, which reads the
+user's data version (database.data_version) before the route runs: a request
+whose If-None-Match holds the current ETag gets a 304 straight away, so the
+listing or aggregation query is never run. Otherwise the ETag goes out with
+the response.
+
+The ETag is weak, as it names the user's data rather than the bytes of one
+representation, and carries the date too, for the totals of today, this
+week and this month. Responses vary by the Authorization header and may
+only be kept by the client's private cache.
+"""
+import datetime
+import threading
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.outh2 import get_current_user
+from database import data_version
+from database.database import get_async_db
+from schema.schemas import UserPrincipal
+
+# bump when the layout of a response changes, so cached bodies are not reused
+RESPONSE_FORMAT_VERSION = 1
+
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+_lock = threading.Lock()
+# route path -> [requests, 304 responses]
+_metrics = {}
+
+
+def data_etag(user_id: int, version: int, today: datetime.date):
+    return f'W/"{RESPONSE_FORMAT_VERSION}.{user_id}.{version}.{today:%Y%m%d}"'
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """Whether an If-None-Match header value matches `etag`, compared weakly
+    as RFC 9110 asks of GET."""
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """Raises a 304 when the client has the current data; otherwise adds
+    the ETag and caching headers to the response and returns them, for
+    routes that build their own Response."""
+    version = await data_version.current(db, current_user.id)
+    headers = {
+        "ETag": data_etag(current_user.id, version, datetime.date.today()),
+        **CACHE_HEADERS,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    not_modified = if_none_match is not None and etag_matches(if_none_match, headers["ETag"])
+
+    route = request.scope["route"].path
+    with _lock:
+        counts = _metrics.setdefault(route, [0, 0])
+        counts[0] += 1
+        counts[1] += not_modified
+
+    if not_modified:
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return headers
+
+
+def conditional_metrics():
+    with _lock:
+        routes = {route: list(counts) for route, counts in _metrics.items()}
+
+    requests = sum(counts[0] for counts in routes.values())
+    not_modified = sum(counts[1] for counts in routes.values())
+
+    return {
+        "requests": requests,
+        "not_modified": not_modified,
+        "not_modified_ratio": not_modified / requests if requests else 0.0,
+        "routes": {
+            route: {
+                "requests": route_requests,
+                "not_modified": route_not_modified,
+                "not_modified_ratio": route_not_modified / route_requests,
+            }
+            for route, (route_requests, route_not_modified) in sorted(routes.items())
+        },
+    }
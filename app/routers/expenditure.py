@@ -1,16 +1,27 @@
-from fastapi import APIRouter, Depends, Response
+import asyncio
+import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.outh2 import get_current_user
 from database import db_expenditure
-from database.database import get_db
+from database.database import get_async_db
+from database.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from database.export import export_response
+from jobs import statements
+from routers.conditional import conditional_get, etag_matches
+from routers.responses import model_list_response
 from schema.schemas import (
     ExpenditureBase,
     ExpenditureDisplay,
-    UserAuth,
+    UserPrincipal,
     TransactionBase,
+    StatementJobDisplay,
 )
 
 router = APIRouter(prefix="/expenditure", tags=["Expenditures"])
@@ -19,8 +30,8 @@ router = APIRouter(prefix="/expenditure", tags=["Expenditures"])
 @router.post("", response_model=ExpenditureDisplay)
 async def create_expenditure(
         request: ExpenditureBase,
-        db: Session = Depends(get_db),
-        current_user: UserAuth = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     """
 
@@ -29,27 +40,67 @@ async def create_expenditure(
     :param current_user:
     :return:
     """
-    return db_expenditure.create_expenditure(request, db, current_user.id)
+    return await db_expenditure.create_expenditure(request, db, current_user.id)
 
 
 @router.get("", response_model=list[ExpenditureDisplay])
 async def user_expenditures(
-        db: Session = Depends(get_db), current_user: UserAuth = Depends(get_current_user)
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(get_current_user),
+        headers: dict = Depends(conditional_get),
 ):
     """
 
+    :param limit: page size
+    :param cursor: the X-Next-Cursor header of the previous page
     :param db:
     :param current_user:
-    :return:
+    :param headers: the ETag and caching headers of the user's data
+    :return: one page of expenditures, most recent first
+    """
+    expenditures, next_cursor = await db_expenditure.user_expenditures(
+        db, current_user.id, limit, cursor
+    )
+    if next_cursor:
+        headers = {**headers, "X-Next-Cursor": next_cursor}
+
+    return model_list_response(ExpenditureDisplay, expenditures, headers)
+
+
+@router.get("/export")
+async def export_expenditures(
+        format: Literal["csv", "ndjson"] = "csv",
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        gzip: bool = False,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(get_current_user),
+):
     """
-    return db_expenditure.user_expenditures(db, current_user.id)
 
+    :param format: csv or ndjson
+    :param start: first paid_on date to include
+    :param end: last paid_on date to include
+    :param gzip: gzip-encode the stream
+    :param db:
+    :param current_user:
+    :return: a streamed download of the expenditures
+    """
+    chunks = db_expenditure.export_expenditures(
+        db, current_user.id, format, start, end, gzip
+    )
+    return export_response(chunks, "expenditures", format, gzip)
 
-@router.get('/transactions')
+
+@router.get('/transactions', dependencies=[Depends(conditional_get)])
 async def transactions(
-        db: Session = Depends(get_db), current_user: UserAuth = Depends(get_current_user)):
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(get_current_user),
+):
         
-    total_credits, total_expenses, total_transaction, money_at_hand = db_expenditure.total_transactions(db, current_user.id)
+    total_credits, total_expenses, total_transaction, money_at_hand = await db_expenditure.total_transactions(db, current_user.id)
 
     transactions = TransactionBase(
         total_credits=total_credits,
@@ -64,8 +115,8 @@ async def transactions(
 @router.delete("/delete/{expend_id}")
 async def delete_expenditure(
         expend_id: int,
-        db: Session = Depends(get_db),
-        current_user: UserAuth = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     """
 
@@ -75,15 +126,15 @@ async def delete_expenditure(
     :return:
     """
 
-    return db_expenditure.delete_expenditure(expend_id, db, current_user.id)
+    return await db_expenditure.delete_expenditure(expend_id, db, current_user.id)
 
 
 @router.put("/edit/{expend_id}")
 async def edit_expenditure(
         request: ExpenditureBase,
         expend_id: int,
-        db: Session = Depends(get_db),
-        current_user: UserAuth = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     """
 
@@ -94,17 +145,64 @@ async def edit_expenditure(
     :return:
     """
 
-    return db_expenditure.edit_expenditure(request, expend_id, db, current_user.id)
+    return await db_expenditure.edit_expenditure(request, expend_id, db, current_user.id)
+
+
+def statement_file_response(job, username: str, request: Request):
+    file_path, etag = statements.finished_file(job)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    file_name = f'{username}.pdf'
+    headers['Content-disposition'] = f'attachment; filename={file_name}'
+
+    return FileResponse(file_path, headers=headers)
+
+
+@router.post("/statement", response_model=StatementJobDisplay,
+             status_code=status.HTTP_202_ACCEPTED)
+async def request_statement(
+        current_user: UserPrincipal = Depends(get_current_user),
+):
+    """Queue a PDF statement of all expenditures.
+
+    :param current_user:
+    :return: the job, to poll at /expenditure/statement/{job_id}
+    """
+    job, _ = await run_in_threadpool(statements.enqueue, current_user.id)
+    return job
+
+
+@router.get("/statement/{job_id}", response_model=StatementJobDisplay)
+async def statement_status(
+        job_id: str,
+        current_user: UserPrincipal = Depends(get_current_user),
+):
+    return await run_in_threadpool(statements.get_job, job_id, current_user.id)
+
+
+@router.get("/statement/{job_id}/download")
+async def download_statement(
+        job_id: str,
+        request: Request,
+        current_user: UserPrincipal = Depends(get_current_user),
+):
+    job = await run_in_threadpool(statements.get_job, job_id, current_user.id)
+    return statement_file_response(job, current_user.username, request)
 
 
 @router.get("/statement")
 async def get_statement(
-        response: Response,
-        db: Session = Depends(get_db),
-        current_user: UserAuth = Depends(get_current_user),
+        request: Request,
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
-    db_expenditure.expenditures_to_pdf(db, current_user.id, response)
-    file_path = f'statements/{current_user.username}.pdf'
-    file_name = f'{current_user.username}.pdf'
+    """Queue a statement and wait for it without blocking the event loop.
+    Kept for clients that do not poll the job endpoints."""
+    job, future = await run_in_threadpool(statements.enqueue, current_user.id)
+    await asyncio.wrap_future(future)
+    job = await run_in_threadpool(statements.get_job, job.id, current_user.id)
 
-    return FileResponse(file_path, headers={'Content-disposition': f'attachment; filename={file_name}'})
+    return statement_file_response(job, current_user.username, request)
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from auth.outh2 import get_current_user
+from auth.user_cache import cache_metrics
+from database.hashing import password_metrics
+from routers.conditional import conditional_metrics
+from schema.schemas import UserPrincipal
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("")
+async def metrics(current_user: UserPrincipal = Depends(get_current_user)):
+    """In-process counters of this worker, for admins only.
+
+    :param current_user:
+    :return: metrics grouped by component
+    """
+    if current_user.user_type != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorized for this information, contact Admin.",
+        )
+
+    return {
+        "password_hashing": password_metrics(),
+        "auth_cache": cache_metrics(),
+        "conditional_get": conditional_metrics(),
+    }
@@ -0,0 +1,20 @@
+"""JSON responses encoded by pydantic-core.
+
+For a response_model FastAPI validates the return value, converts it back
+to plain Python data and hands that to json.dumps. The listings, which can
+run to thousands of rows, opt into model_list_response instead: the rows
+are validated once and pydantic-core writes the JSON bytes directly. The
+body is the same, and the routes keep their response_model for the
+OpenAPI schema.
+"""
+from fastapi import Response
+
+from schema.schemas import list_adapter
+
+
+def model_list_response(model, rows, headers: dict = None):
+    """A JSON response of `rows` (ORM objects, row tuples or dicts) as a
+    list of `model`."""
+    adapter = list_adapter(model)
+    body = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends
+import datetime
+from typing import Any, Literal, Optional
 
-from sqlalchemy.orm.session import Session
+from fastapi import APIRouter, Body, Depends, Query
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth.outh2 import get_current_user
 from database import db_sales
-from database.database import get_db
+from database.database import get_async_db
+from database.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from database.export import export_response
+from routers.conditional import conditional_get
+from routers.responses import model_list_response
 from schema.schemas import (
     SaleBase,
-    UserAuth,
+    SaleBatchResult,
+    UserPrincipal,
     SaleDisplay,
     SalesTransactionDisplay,
+    SalesSeriesDisplay,
     TransactionHistoryDisplay,
 )
 
@@ -19,35 +28,78 @@ router = APIRouter(prefix="/sales", tags=["Sales"])
 @router.post("", response_model=SaleDisplay)
 async def create_sale(
     request: SaleBase,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    return await db_sales.create_sale(request, db, current_user.id)
+
+
+@router.post("/batch", response_model=list[SaleBatchResult])
+async def create_sales(
+    # any JSON values: an item that is not an object gets its own error
+    # result from create_sales instead of failing the whole request
+    request: list[Any] = Body(
+        description="SaleBase items, validated one by one"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    return db_sales.create_sale(request, db, current_user.id)
+    """Record many sales at once. Each item gets a result with the new sale
+    id (status_code 201) or the error that kept it out; valid items are
+    saved even when others fail."""
+    return await db_sales.create_sales(request, db, current_user.id)
 
 
 @router.get("/all-sales", response_model=list[SaleDisplay])
 async def get_all_sales(
-    db: Session = Depends(get_db), current_user: UserAuth = Depends(get_current_user)
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    headers: dict = Depends(conditional_get),
 ):
-    return db_sales.user_sales(db, current_user.id)
+    """One page of sales, most recent first. When there are more, the
+    X-Next-Cursor header holds the `cursor` of the next page."""
+    sales, next_cursor = await db_sales.user_sales(db, current_user.id, limit, cursor)
+    if next_cursor:
+        headers = {**headers, "X-Next-Cursor": next_cursor}
+
+    return model_list_response(SaleDisplay, sales, headers)
+
+
+@router.get("/export")
+async def export_sales(
+    format: Literal["csv", "ndjson"] = "csv",
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """Stream every sale between `start` and `end` as a CSV or NDJSON
+    download, gzip-encoded when `gzip` is set."""
+    chunks = db_sales.export_sales(db, current_user.id, format, start, end, gzip)
+    return export_response(chunks, "sales", format, gzip)
 
 
 @router.get("/on-date/{date}", response_model=list[SaleDisplay])
 async def get_sales_by_date(
     date,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    headers: dict = Depends(conditional_get),
 ):
-    return db_sales.daily_sales(date, db, current_user.id)
+    sales = await db_sales.daily_sales(date, db, current_user.id)
+    return model_list_response(SaleDisplay, sales, headers)
 
 
-@router.get("/trasactions/{date}")
+@router.get("/trasactions/{date}", dependencies=[Depends(conditional_get)])
 async def sales_transactions(
     date,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    sales, debpts, profit, percentage_profit = db_sales.daily_transaction(
+    sales, debpts, profit, percentage_profit = await db_sales.daily_transaction(
         date, db, current_user.id
     )
 
@@ -60,11 +112,14 @@ async def sales_transactions(
     return transactions
 
 
-@router.get("/transaction-hisory")
+@router.get("/transaction-hisory", dependencies=[Depends(conditional_get)])
 async def transaction_history(
-    db: Session = Depends(get_db), current_user: UserAuth = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    today, weekly, monthly, all_sales = db_sales.transaction_history(db, current_user.id)
+    today, weekly, monthly, all_sales = await db_sales.transaction_history(
+        db, current_user.id
+    )
 
     today_sales, today_profits, today_debpts, today_perc_profit = today
     weekly_sales, weekly_profits, weekly_debts, weekly_perc_profit = weekly
@@ -93,17 +148,46 @@ async def transaction_history(
     return transactions
 
 
+@router.get("/series", response_model=list[SalesSeriesDisplay],
+            dependencies=[Depends(conditional_get)])
+async def sales_series(
+    start: datetime.date = Query(alias="from"),
+    end: datetime.date = Query(alias="to"),
+    bucket: Literal["day", "week", "month"] = "day",
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """Totals of every day, week (from Sunday) or month between `from`
+    and `to`, for charts. Buckets without sales are zero."""
+    series = await db_sales.sales_series(db, current_user.id, start, end, bucket)
+
+    return [
+        SalesSeriesDisplay(
+            bucket=bucket_start,
+            sale_count=count,
+            total_sales=sales,
+            total_profits=profit,
+            total_debpts=debpts,
+            percentage_profit=format(profit / bought * 100 if bought else 0, ".2f"),
+        )
+        for bucket_start, count, sales, bought, profit, debpts in series
+    ]
+
+
 @router.get("/depts", response_model=list[SaleDisplay])
 async def sales_on_debpt(
-    db: Session = Depends(get_db), current_user: UserAuth = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    headers: dict = Depends(conditional_get),
 ):
-    return db_sales.filter_by_balance(db, current_user.id)
+    sales = await db_sales.filter_by_balance(db, current_user.id)
+    return model_list_response(SaleDisplay, sales, headers)
 
 
 @router.delete("/{sale_id}")
 async def delete_sale(
     sale_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    return db_sales.delete_sale(sale_id, db, current_user.id)
+    return await db_sales.delete_sale(sale_id, db, current_user.id)
@@ -0,0 +1,141 @@
+"""Static serving of the /images mount.
+
+Images stored by jobs.images are named after the hash of their content,
+so their URLs are versioned: they are served with a year long, immutable
+Cache-Control and a strong ETag taken from the hash. Older files under
+reused names (images/{username}.png) must be revalidated on every use,
+which the ETag turns into a 304 instead of a download.
+
+Text images (svg) are stored with .br and .gz siblings, served to clients
+that accept them. Where the ASGI server offers the pathsend or zerocopysend
+extension, file bodies are handed to it instead of being read into Python.
+"""
+import os
+import re
+from email.utils import parsedate
+from mimetypes import guess_type
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from jobs.images import PRECOMPRESSED_TYPES
+from middleware.compression import accepted_encodings
+from routers.conditional import etag_matches
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# {sha256}.{ext} or {sha256}_{size}.webp, see jobs.images
+HASHED_NAME = re.compile(r"^(?P<version>[0-9a-f]{64}(?:_\d+)?)\.\w+$")
+
+# Content-Encoding -> suffix of the precompressed sibling, preferred first
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+class ImageFileResponse(FileResponse):
+    """A FileResponse that lets the server send the body itself when it
+    supports the pathsend or zerocopysend extensions."""
+
+    async def __call__(self, scope, receive, send):
+        extensions = scope.get("extensions") or {}
+        zero_copy = "http.response.pathsend" in extensions or (
+            "http.response.zerocopysend" in extensions
+        )
+        if self.send_header_only or self.stat_result is None or not zero_copy:
+            await super().__call__(scope, receive, send)
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+        else:
+            file = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "count": self.stat_result.st_size,
+                        "more_body": False,
+                    }
+                )
+            finally:
+                file.close()
+
+        if self.background is not None:
+            await self.background()
+
+
+class ImageFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        name = os.path.basename(full_path)
+        extension = name.rsplit(".", 1)[-1].lower()
+
+        hashed = HASHED_NAME.match(name)
+        if hashed:
+            cache_control = IMMUTABLE
+            version = hashed["version"]
+        else:
+            cache_control = REVALIDATE
+            version = f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+
+        headers = {"cache-control": cache_control}
+        body_path = full_path
+        if extension in PRECOMPRESSED_TYPES:
+            headers["vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers)
+            for encoding, suffix in ENCODINGS.items():
+                if encoding not in accepted:
+                    continue
+                # blocking, but only svg requests get here and the file
+                # sits next to the one StaticFiles just found
+                try:
+                    stat_result = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                body_path = full_path + suffix
+                headers["content-encoding"] = encoding
+                version = f"{version}-{encoding}"
+                break
+
+        headers["etag"] = f'"{version}"'
+
+        response = ImageFileResponse(
+            body_path,
+            status_code=status_code,
+            headers=headers,
+            # the type of the image, not of its .br / .gz sibling
+            media_type=guess_type(full_path)[0] or "text/plain",
+            stat_result=stat_result,
+            method=scope["method"],
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        """If-None-Match as a list of tags, see etag_matches;
+        If-Modified-Since only counts without it."""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, response_headers.get("etag", ""))
+
+        try:
+            if_modified_since = parsedate(request_headers["if-modified-since"])
+            last_modified = parsedate(response_headers["last-modified"])
+        except KeyError:
+            return False
+        return (
+            if_modified_since is not None
+            and last_modified is not None
+            and if_modified_since >= last_modified
+        )
@@ -1,17 +1,17 @@
-import shutil
-import os
-
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm.session import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.outh2 import get_current_user
 from database import db_user
-from database.database import get_db
+from database.database import get_async_db
 from database.models import User
+from jobs import images
+from routers.responses import model_list_response
 from schema.schemas import (
     UserBase,
     UserDisplay,
-    UserAuth,
+    UserPrincipal,
     UserEditUserType,
     UserEditPassword,
 )
@@ -20,7 +20,7 @@ router = APIRouter(prefix="/user", tags=["Users"])
 
 
 @router.post("/new", response_model=UserDisplay)
-async def create_user(request: UserBase, db: Session = Depends(get_db)):
+async def create_user(request: UserBase, db: AsyncSession = Depends(get_async_db)):
     """
 
     :param request: user data
@@ -28,12 +28,13 @@ async def create_user(request: UserBase, db: Session = Depends(get_db)):
     :return: the created user
     """
 
-    return db_user.create_user(request, db)
+    return await db_user.create_user(request, db)
 
 
 @router.get("", response_model=list[UserDisplay])
 async def all_users(
-    db: Session = Depends(get_db), current_user: UserAuth = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     """
 
@@ -41,23 +42,24 @@ async def all_users(
     :param db: the database
     :return: all users
     """
-    return db_user.get_all_users(db, current_user.id)
+    users = await db_user.get_all_users(db, current_user)
+    return model_list_response(UserDisplay, users)
 
 
 @router.get("/{username}", response_model=UserDisplay)
 async def get_user_username(
     username: str,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    return db_user.retrieve_user_by_username(username, db, current_user.id)
+    return await db_user.retrieve_user_by_username(username, db, current_user)
 
 
 @router.delete("/{user_id}")
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     """
 
@@ -66,62 +68,63 @@ async def delete_user(
     :param db:
     :return:
     """
-    return db_user.delete_user(user_id, db, current_user.id)
+    return await db_user.delete_user(user_id, db, current_user)
 
 
 @router.put("/edit_user/{username}", response_model=UserDisplay)
 async def edit_user_type(
     request: UserEditUserType,
     username: str,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    return db_user.edit_user_type(request, username, db, current_user.id)
+    return await db_user.edit_user_type(request, username, db, current_user)
 
 
 @router.put("/edit_password/{username}", response_model=UserDisplay)
 async def change_password(
     request: UserEditPassword,
     username: str,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    return db_user.edit_user_password(request, username, db, current_user.id)
+    return await db_user.edit_user_password(request, username, db, current_user)
 
 
 @router.put("/reset_password/{username}", response_model=UserDisplay)
 async def reset_password(
     username: str,
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    return db_user.reset_password(username, db, current_user.id)
+    return await db_user.reset_password(username, db, current_user)
 
 
 @router.post("/image")
 async def upload_image(
     image: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: UserAuth = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     """Uploads an image to the server
 
     Args:
         image (UploadFile, optional): the image file.
         Default to File(...).
-        Current_user (UserAuth, optional): logged user.
+        Current_user (UserPrincipal, optional): logged user.
         Defaults Depend on(get_current_user).
 
     Raises:
-        HTTPException: image file not supported
+        HTTPException: image file not supported, not an image or larger
+        than CASHER_MAX_IMAGE_MB
 
     Returns:
-        str: file name saved in server
+        dict: paths of the image and its thumbnails saved in server
         :param image:
         :param current_user:
     """
 
-    user = db.query(User).filter(User.id == current_user.id).first()
+    user = await db.get(User, current_user.id)
 
     if not user:
         raise HTTPException(
@@ -129,7 +132,7 @@ async def upload_image(
             detail="You must log in to upload an image.",
         )
 
-    image_file_type = image.filename.rsplit(".", 1)[1]
+    image_file_type = image.filename.rsplit(".", 1)[-1].lower()
 
     allowed_image_types = {"jpg", "png", "jpeg", "webm", "gif", "svg"}
 
@@ -140,24 +143,24 @@ async def upload_image(
             f'formats are {", ".join(allowed_image_types)}.',
         )
 
-    filename = image.filename.rsplit(".", 1)
-
-    images = os.listdir(path='images')
+    path = await images.save_upload(image, user.id, image_file_type)
+    thumbnails = await images.thumbnails(path, image_file_type)
+    await run_in_threadpool(images.precompress, path, image_file_type)
 
-    for pic in images:
-        pic_name = pic.rsplit(".", 1)[0]
-        if pic_name == user.username:
-            os.remove(f'images/{pic}')
-    
-    path = f"images/{user.username}.{filename[-1]}"
+    old_paths = {user.user_image_url, user.user_image_small_url, user.user_image_medium_url}
 
-    with open(path, "w+b") as buffer:
-        shutil.copyfileobj(image.file, buffer)
-    
     try:
-        user.user_image_url = f'{path}'
-        db.commit()
+        user.user_image_url = path
+        for column, thumbnail in thumbnails.items():
+            setattr(user, column, thumbnail)
+        await db.commit()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Error in Server, try again later.')
 
-    return {"file_name": path}
+    # the previous files are known from the user record, and re-uploading
+    # the same image keeps its paths
+    await run_in_threadpool(
+        images.remove_images, old_paths - {path, *thumbnails.values()}
+    )
+
+    return {"file_name": path, **thumbnails}
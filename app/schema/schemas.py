@@ -1,6 +1,12 @@
-from datetime import datetime, date
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from enum import Enum
+from functools import lru_cache
+from typing import Annotated, Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import (BaseModel, EmailStr, Field, BeforeValidator,
+                      AfterValidator, TypeAdapter, ValidationError,
+                      model_validator)
 
 
 class UserBase(BaseModel):
@@ -28,6 +34,8 @@ class UserDisplay(BaseModel):
     user_type: str
     username: str
     user_image_url: str
+    user_image_small_url: Optional[str] = None
+    user_image_medium_url: Optional[str] = None
     created_on: datetime
 
     class Config:
@@ -35,10 +43,50 @@ class UserDisplay(BaseModel):
         from_attributes = True
 
 
+# oldest date a ledger entry may carry
+MIN_LEDGER_DATE = date(2000, 1, 1)
+
+
+def _date_part(value):
+    # clients send ISO datetimes, e.g. 2023-05-04T21:00:00.000Z
+    if isinstance(value, str):
+        return value.split("T", 1)[0]
+    return value
+
+
+def _ledger_date(value: date):
+    # tomorrow is allowed as well, matching the day build_sale adds to the
+    # web client's dates: a client ahead of the server's timezone can
+    # already be on the server's tomorrow
+    if not MIN_LEDGER_DATE <= value <= date.today() + timedelta(days=1):
+        raise ValueError(f"Date must be between {MIN_LEDGER_DATE} and tomorrow.")
+    return value
+
+
+def _lower(value):
+    if isinstance(value, str):
+        return value.lower()
+    return value
+
+
+LedgerDate = Annotated[date, BeforeValidator(_date_part), AfterValidator(_ledger_date)]
+
+
+class MoneyType(str, Enum):
+    credit = "credit"
+    expense = "expense"
+
+
+class PaymentMode(str, Enum):
+    cash = "cash"
+    mobile_money = "mobile money"
+    gift = "gift"
+
+
 class ExpenditureBase(BaseModel):
-    money_type: str
-    amount: float
-    paid_on: str
+    money_type: Annotated[MoneyType, BeforeValidator(_lower)]
+    amount: float = Field(ge=0)
+    paid_on: LedgerDate
     description: str
 
 
@@ -65,18 +113,41 @@ class TransactionBase(BaseModel):
 class UserAuth(BaseModel):
     id: int
     username: str
-    email: EmailStr
+    # validated by UserBase when stored; checking it again for every listed
+    # sale that embeds it cost more than the rest of the row
+    email: str
+
+
+class UserPrincipal(BaseModel):
+    """The authenticated user, as cached per access token."""
+    id: int
+    username: str
+    email: str
+    user_type: str
+
+    class Config:
+        from_attributes = True
+        frozen = True
 
 
 class SaleBase(BaseModel):
-    item: str
-    bought_amount: int
-    sell_amount: int
-    mode_of_payment: str
+    item: str = Field(min_length=1)
+    bought_amount: int = Field(ge=0)
+    sell_amount: int = Field(ge=0)
+    mode_of_payment: Annotated[PaymentMode, BeforeValidator(_lower)]
     transaction_code: str
-    balance: int
+    balance: int = Field(ge=0)
     description: str
-    sold_on: str
+    sold_on: LedgerDate
+
+    @model_validator(mode="after")
+    def gift_when_free(self):
+        if self.sell_amount == 0 and self.mode_of_payment != PaymentMode.gift:
+            raise ValueError(
+                f"I have noticed you sold this {self.item} at 0 price, if it "
+                f"was a gift select `gift` on mode of payment."
+            )
+        return self
 
 
 class SaleDisplay(BaseModel):
@@ -98,6 +169,13 @@ class SaleDisplay(BaseModel):
         from_attributes = True
 
 
+class SaleBatchResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+
+
 class SalesTransactionDisplay(BaseModel):
     total_sales: int
     total_profits: int
@@ -105,6 +183,15 @@ class SalesTransactionDisplay(BaseModel):
     percentage_profit: float
 
 
+class SalesSeriesDisplay(BaseModel):
+    bucket: date
+    sale_count: int
+    total_sales: int
+    total_profits: int
+    total_debpts: int
+    percentage_profit: float
+
+
 class TransactionHistoryDisplay(BaseModel):
     today_sales: int
     today_profits: int
@@ -122,3 +209,43 @@ class TransactionHistoryDisplay(BaseModel):
     all_profits: int
     all_debpts: int
     all_perc_profit: float
+
+
+class StatementJobDisplay(BaseModel):
+    id: str
+    status: str
+    progress: int
+    error: Optional[str] = None
+    created_on: datetime
+    finished_on: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+@lru_cache
+def list_adapter(model):
+    """The TypeAdapter of list[model], built once per model."""
+    return TypeAdapter(list[model])
+
+
+def validate_each(model, items: list):
+    """Validate `items` as `model` instances in a single pydantic-core pass.
+
+    Returns the (index, instance) pairs of the valid items and a
+    {index: error message} dict for the others.
+    """
+    try:
+        return list(enumerate(list_adapter(model).validate_python(items))), {}
+    except ValidationError as e:
+        errors = defaultdict(list)
+        for error in e.errors():
+            index, *field = error["loc"]
+            message = error["msg"]
+            errors[index].append(f"{'.'.join(map(str, field))}: {message}" if field else message)
+
+    valid = [
+        (index, model.model_validate(item))
+        for index, item in enumerate(items) if index not in errors
+    ]
+    return valid, {index: "; ".join(messages) for index, messages in errors.items()}